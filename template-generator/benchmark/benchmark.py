@@ -0,0 +1,260 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_model import write_model  # noqa: E402
+
+PHASES = (
+    "load",
+    "read_xmi",
+    "load_api",
+    "load_ct",
+    "resolve",
+    "columns",
+    "write",
+    "check",
+)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="""
+        Template generator benchmark. Creates synthetic USDM models of the
+        sizes specified in the --sizes option, times each phase of the
+        template generation for each of them and optionally stores the
+        timings as a JSON baseline (specified in the -o option) or compares
+        them with a previously stored baseline (specified in the -b option),
+        exiting with status 1 if any phase got slower by more than the
+        threshold."""
+    )
+    parser.add_argument(
+        "--sizes",
+        help="[Optional] Comma separated numbers of classes of the models to "
+        + "benchmark. Default is 50,200,500.",
+        default="50,200,500",
+    )
+    parser.add_argument(
+        "--attributes",
+        help="[Optional] Number of attributes per class. Default is 6.",
+        type=int,
+        default=6,
+    )
+    parser.add_argument(
+        "--depth",
+        help="[Optional] Generalization depth. Default is 1.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--fanout",
+        help="[Optional] Relationship fan-out per class. Default is 3.",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "--cycles",
+        help="[Optional] Number of relationship cycles. Default is 2.",
+        type=int,
+        default=2,
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        help="[Optional] Number of runs per model, of which the fastest time "
+        + "of each phase is kept. Default is 3.",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "-d",
+        "--work_dir",
+        help="[Optional] Directory in which to keep the synthetic models. "
+        + "Default is a temporary directory.",
+        default=None,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        help="[Optional] JSON file in which to store the timings as a baseline.",
+        default=None,
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        help="[Optional] JSON baseline to compare the timings with. The model "
+        + "parameters recorded in the baseline replace the --sizes, "
+        + "--attributes, --depth, --fanout and --cycles options.",
+        default=None,
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        help="[Optional] Relative slowdown of a phase compared with the "
+        + "baseline that is reported as a regression. Default is 0.25 (25%%).",
+        type=float,
+        default=0.25,
+    )
+    parser.add_argument(
+        "-m",
+        "--min_delta",
+        help="[Optional] Slowdown in seconds below which a phase is never "
+        + "reported as a regression, to ignore noise in very fast phases. "
+        + "Default is 0.05.",
+        type=float,
+        default=0.05,
+    )
+    return parser.parse_args()
+
+
+def time_phases(xmi_file: str, ct_file: str, api_spec: str) -> dict:
+    # Runs the phases of the template generation in turn, as create_template
+    # does, and returns the time taken by each. Run in a fresh process so that
+    # imports and memoized results of earlier runs are not reused.
+    from template_generator import (
+        TemplateGenerator,
+        get_inflect,
+        load_api,
+        load_ct,
+        load_inputs,
+    )
+    from xmi_reader import read_xmi
+
+    timings = {}
+
+    def timed(phase, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[phase] = time.perf_counter() - start
+        return result
+
+    # The concurrent load of the three files runs first, so that its worker
+    # processes import the loaders' dependencies just as in a cold start.
+    timed("load", load_inputs, xmi_file, ct_file, api_spec, [])
+    usdmxmi = timed("read_xmi", read_xmi, xmi_file)
+    apidict = timed("load_api", load_api, api_spec, [])
+    entdict = timed("load_ct", load_ct, ct_file, [])
+    # The one-off import of inflect is not part of resolving the model.
+    get_inflect()
+    generator = timed(
+        "resolve",
+        lambda: TemplateGenerator(
+            xmi_file,
+            ct_file,
+            api_spec,
+            usdmxmi=usdmxmi,
+            apidict=apidict,
+            entdict=entdict,
+        ),
+    )
+    entprps = timed(
+        "columns",
+        lambda: list(
+            generator.get_all_entity_properties(list(generator.entdict.keys()), 1)
+        ),
+    )
+    timed("write", generator.write_template, io.BytesIO(), entprps)
+    generator.set_model(generator.model)
+    timed("check", generator.check)
+    return timings
+
+
+def run_benchmark(parameters: dict, repeat: int, work_dir: str) -> dict:
+    results = {}
+    for size in parameters["sizes"]:
+        files = write_model(
+            os.path.join(work_dir, f"model_{size}"),
+            size,
+            parameters["attributes"],
+            parameters["depth"],
+            parameters["fanout"],
+            parameters["cycles"],
+        )
+        timings = {}
+        for _ in range(repeat):
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                run = pool.submit(time_phases, *files).result()
+            for phase, seconds in run.items():
+                timings[phase] = min(seconds, timings.get(phase, seconds))
+        results[str(size)] = timings
+        print(
+            f"{size} classes: "
+            + ", ".join(f"{x} {timings[x]:.3f}s" for x in PHASES if x in timings)
+        )
+    return results
+
+
+def get_regressions(
+    results: dict, baseline: dict, threshold: float, min_delta: float
+) -> list:
+    regressions = []
+    for size, timings in results.items():
+        for phase, seconds in timings.items():
+            base = baseline["results"].get(size, {}).get(phase)
+            if (
+                base is not None
+                and seconds > base * (1 + threshold)
+                and seconds - base > min_delta
+            ):
+                regressions.append(
+                    f"{size} classes: {phase} took {seconds:.3f}s, "
+                    + f"{seconds / base - 1:.0%} slower than the baseline "
+                    + f"{base:.3f}s"
+                )
+    return regressions
+
+
+def main():
+    args = parse_arguments()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        parameters = baseline["parameters"]
+    else:
+        parameters = {
+            "sizes": [int(x) for x in args.sizes.split(",")],
+            "attributes": args.attributes,
+            "depth": args.depth,
+            "fanout": args.fanout,
+            "cycles": args.cycles,
+        }
+
+    if args.work_dir:
+        results = run_benchmark(parameters, args.repeat, args.work_dir)
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = run_benchmark(parameters, args.repeat, work_dir)
+
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "parameters": parameters,
+                    "results": results,
+                },
+                f,
+                indent=1,
+            )
+
+    if baseline:
+        regressions = get_regressions(results, baseline, args.threshold, args.min_delta)
+        for regression in regressions:
+            print(regression)
+        print(f"{len(regressions)} regressions found")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,672 @@
+import argparse
+import os
+import random
+import yaml
+import xlsxwriter
+from xml.sax.saxutils import quoteattr
+
+WORDS = [
+    "study",
+    "design",
+    "arm",
+    "epoch",
+    "cell",
+    "element",
+    "activity",
+    "procedure",
+    "encounter",
+    "timing",
+    "objective",
+    "endpoint",
+    "estimand",
+    "population",
+    "cohort",
+    "criterion",
+    "intervention",
+    "amendment",
+    "reason",
+    "scope",
+    "site",
+    "organization",
+    "address",
+    "identifier",
+    "title",
+    "document",
+    "version",
+    "condition",
+    "range",
+    "quantity",
+    "masking",
+    "timeline",
+    "instance",
+    "exit",
+    "category",
+    "property",
+    "concept",
+    "surrogate",
+    "dictionary",
+    "narrative",
+]
+
+ATTR_TYPES = ["String", "Integer", "Boolean", "Float"]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="""
+        Synthetic USDM model generator. Writes an Enterprise Architect style
+        XMI export, a USDM CT Excel file and a USDM API specification in YAML
+        format describing a synthetic model of the requested size."""
+    )
+    parser.add_argument(
+        "-d",
+        "--output_dir",
+        help="Directory in which to write USDM_UML.xmi, USDM_CT.xlsx and "
+        + "USDM_API.yaml",
+        required=True,
+    )
+    parser.add_argument(
+        "--classes",
+        help="[Optional] Number of concrete classes. Default is 40.",
+        type=int,
+        default=40,
+    )
+    parser.add_argument(
+        "--attributes",
+        help="[Optional] Number of attributes added to each class on top of "
+        + "id, name, description and instanceType. Default is 6.",
+        type=int,
+        default=6,
+    )
+    parser.add_argument(
+        "--depth",
+        help="[Optional] Depth of the generalization hierarchy that every "
+        + "other class specializes. Default is 1.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--fanout",
+        help="[Optional] Number of relationships from each class to the "
+        + "classes following it. Default is 3.",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "--cycles",
+        help="[Optional] Number of classes with a relationship back to the "
+        + "first class. Default is 2.",
+        type=int,
+        default=2,
+    )
+    parser.add_argument(
+        "--seed",
+        help="[Optional] Seed of the random names and types. Default is 1.",
+        type=int,
+        default=1,
+    )
+    return parser.parse_args()
+
+
+def camel(*words: str) -> str:
+    return words[0] + "".join(w.title() for w in words[1:])
+
+
+def pascal(*words: str) -> str:
+    return "".join(w.title() for w in words)
+
+
+def build_model(
+    classes: int, attributes: int, depth: int, fanout: int, cycles: int, seed: int
+) -> dict:
+    rnd = random.Random(seed)
+    model = {"classes": [], "version": "9.{}".format(classes)}
+    model["classes"].append(
+        {
+            "name": "Code",
+            "abstract": False,
+            "general": None,
+            "attributes": [
+                ("id", "String", "1", "1", None),
+                ("code", "String", "1", "1", None),
+                ("codeSystem", "String", "1", "1", None),
+                ("codeSystemVersion", "String", "1", "1", None),
+                ("decode", "String", "1", "1", None),
+                ("instanceType", "String", "1", "1", None),
+            ],
+            "links": [],
+        }
+    )
+    model["classes"].append(
+        {
+            "name": "AliasCode",
+            "abstract": False,
+            "general": None,
+            "attributes": [
+                ("id", "String", "1", "1", None),
+                ("instanceType", "String", "1", "1", None),
+            ],
+            "links": [
+                ("standardCode", "Code", "1", True),
+                ("standardCodeAliases", "Code", "0..*", True),
+            ],
+        }
+    )
+    # Only the root of the generalization hierarchy is abstract, as the
+    # template generator describes inherited attributes through the class
+    # directly below the one defining them.
+    for lvl in range(depth):
+        model["classes"].append(
+            {
+                "name": "BaseLevel{}".format(lvl),
+                "abstract": lvl == 0,
+                "general": "BaseLevel{}".format(lvl - 1) if lvl else None,
+                "attributes": [
+                    (camel("level", str(lvl), "label"), "String", "0", "1", None)
+                ],
+                "links": [],
+            }
+        )
+    names = []
+    for i in range(classes):
+        words = rnd.sample(WORDS, 2)
+        names.append(pascal(*words) + str(i))
+    for i, name in enumerate(names):
+        attrs = [
+            ("id", "String", "1", "1", None),
+            ("name", "String", "1", "1", None),
+            ("description", "String", "0", "1", None),
+            ("instanceType", "String", "1", "1", None),
+        ]
+        for a in range(attributes):
+            attrs.append(
+                (
+                    camel(rnd.choice(WORDS), rnd.choice(WORDS), str(a)),
+                    rnd.choice(ATTR_TYPES),
+                    rnd.choice(["0", "1"]),
+                    rnd.choice(["1", "1", "*"]),
+                    None,
+                )
+            )
+        links = [
+            (camel(rnd.choice(WORDS), "type"), "Code", "1", True),
+            (camel(rnd.choice(WORDS), "codes"), "Code", "0..*", True),
+            ("aliasCode", "AliasCode", "0..1", True),
+        ]
+        for f in range(1, fanout + 1):
+            if i + f < len(names):
+                tgt = names[i + f]
+                single = (i + f) % 2 == 0
+                contained = f % 2 == 1
+                lname = rnd.choice(WORDS)
+                links.append(
+                    (
+                        camel(lname, "item" if single else "items", str(f)),
+                        tgt,
+                        rnd.choice(["1", "0..1"]) if single else "0..*",
+                        contained,
+                    )
+                )
+        if i < cycles and i + 1 < len(names):
+            links.append((camel("back", "link", str(i)), names[0], "0..1", True))
+        model["classes"].append(
+            {
+                "name": name,
+                "abstract": False,
+                "general": (
+                    "BaseLevel{}".format(depth - 1) if depth and i % 2 else None
+                ),
+                "attributes": attrs,
+                "links": links,
+            }
+        )
+    return model
+
+
+def write_xmi(model: dict, path: str):
+    ids = {c["name"]: "EAID_{:08d}".format(n) for n, c in enumerate(model["classes"])}
+    out = []
+    out.append('<?xml version="1.0" encoding="windows-1252"?>')
+    out.append(
+        '<xmi:XMI xmi:version="2.1" '
+        'xmlns:uml="http://schema.omg.org/spec/UML/2.1" '
+        'xmlns:xmi="http://schema.omg.org/spec/XMI/2.1">'
+    )
+    out.append(
+        '<xmi:Documentation exporter="Enterprise Architect" '
+        'exporterVersion="6.5" exporterID="1628"/>'
+    )
+    out.append('<uml:Model xmi:type="uml:Model" name="EA_Model" visibility="public">')
+    out.append(
+        '<packagedElement xmi:type="uml:Package" xmi:id="EAPK_USDM" '
+        'name="USDM" visibility="public">'
+    )
+    ext_elements = []
+    connectors = []
+    assocs = []
+    cn = 0
+    for c in model["classes"]:
+        cid = ids[c["name"]]
+        out.append(
+            '<packagedElement xmi:type="uml:Class" xmi:id="{}" name="{}" '
+            'visibility="public"{}>'.format(
+                cid, c["name"], ' isAbstract="true"' if c["abstract"] else ""
+            )
+        )
+        ext_attrs = []
+        for an, (aname, atype, lower, upper, _) in enumerate(c["attributes"]):
+            aid = "{}_A{:04d}".format(cid, an)
+            out.append(
+                '<ownedAttribute xmi:type="uml:Property" xmi:id="{}" name="{}" '
+                'visibility="public" isStatic="false" isReadOnly="false" '
+                'isDerived="false" isOrdered="false" isUnique="true" '
+                'isDerivedUnion="false">'.format(aid, aname)
+            )
+            out.append(
+                '<lowerValue xmi:type="uml:LiteralInteger" xmi:id="{0}_L" '
+                'value="{1}"/><upperValue xmi:type="uml:LiteralUnlimitedNatural" '
+                'xmi:id="{0}_U" value="{2}"/>'.format(
+                    aid, lower, "-1" if upper == "*" else upper
+                )
+            )
+            out.append('<type xmi:idref="EAJava_{}"/>'.format(atype.lower()))
+            out.append("</ownedAttribute>")
+            ext_attrs.append(
+                '<attribute xmi:idref="{}" name="{}" scope="Public">'
+                '<initial/><documentation/><model ea_localid="{}" '
+                'ea_guid="{{{}}}"/><properties type="{}" derived="0" '
+                'collection="false" duplicates="0" changeability="changeable"/>'
+                '<coords ordered="0" scale="0"/><containment '
+                'containment="Not Specified" position="{}"/><stereotype/>'
+                '<bounds lower="{}" upper="{}"/><options/><style/>'
+                '<styleex value="volatile=0;"/><tags/><xrefs/>'
+                "</attribute>".format(
+                    aid, aname, cn * 100 + an, aid, atype, an, lower, upper
+                )
+            )
+        for ln, (lname, tgt, mult, _) in enumerate(c["links"]):
+            asid = "{}_C{:04d}".format(cid, ln)
+            out.append(
+                '<ownedAttribute xmi:type="uml:Property" xmi:id="{0}_E" '
+                'visibility="private" association="{0}" isStatic="false" '
+                'isReadOnly="false" isDerived="false" isOrdered="false" '
+                'isUnique="true" isDerivedUnion="false" aggregation="none">'
+                '<type xmi:idref="{1}"/></ownedAttribute>'.format(asid, ids[tgt])
+            )
+            connectors.append(
+                '<connector xmi:idref="{0}" name="{1}"><source xmi:idref="{2}">'
+                '<model ea_localid="{3}" type="Class" name="{4}"/>'
+                '<role visibility="Public" targetScope="instance"/>'
+                '<type aggregation="none" containment="Unspecified"/>'
+                '<constraints/><modifiers isOrdered="false" isNavigable="false"/>'
+                '<style value="Union=0;Derived=0;AllowDuplicates=0;"/>'
+                "<documentation/><xrefs/><tags/></source>"
+                '<target xmi:idref="{5}"><model ea_localid="{6}" type="Class" '
+                'name="{7}"/><role visibility="Public" targetScope="instance"/>'
+                '<type multiplicity="{8}" aggregation="none" '
+                'containment="Unspecified"/><constraints/>'
+                '<modifiers isOrdered="false" isNavigable="true"/>'
+                '<style value="Union=0;Derived=0;AllowDuplicates=0;"/>'
+                "<documentation/><xrefs/><tags/></target>"
+                '<model ea_localid="{9}"/><properties ea_type="Association" '
+                'direction="Source -&gt; Destination"/><modifiers isRoot="false" '
+                'isLeaf="false"/><parameterSubstitutions/><documentation/>'
+                '<appearance linemode="3" linecolor="-1" linewidth="0" '
+                'seqno="0" headStyle="0" lineStyle="0"/><labels/>'
+                '<extendedProperties virtualInheritance="0"/>'
+                '<style value="Mode=3;EOID=1;SOID=2;"/><xrefs/><tags/>'
+                "</connector>".format(
+                    asid,
+                    lname,
+                    cid,
+                    cn,
+                    c["name"],
+                    ids[tgt],
+                    ids[tgt],
+                    tgt,
+                    mult,
+                    len(connectors),
+                )
+            )
+            assocs.append(
+                '<packagedElement xmi:type="uml:Association" xmi:id="{0}" '
+                'name="{1}" visibility="public"><memberEnd xmi:idref="{0}_E"/>'
+                '<memberEnd xmi:idref="{0}_S"/><ownedEnd xmi:type="uml:Property" '
+                'xmi:id="{0}_S" visibility="public" association="{0}" '
+                'isStatic="false" isReadOnly="false" isDerived="false" '
+                'isOrdered="false" isUnique="true" isDerivedUnion="false" '
+                'aggregation="none"><type xmi:idref="{2}"/></ownedEnd>'
+                "</packagedElement>".format(asid, lname, cid)
+            )
+        if c["general"]:
+            gid = "{}_G".format(cid)
+            out.append(
+                '<generalization xmi:type="uml:Generalization" xmi:id="{}" '
+                'general="{}"/>'.format(gid, ids[c["general"]])
+            )
+            connectors.append(
+                '<connector xmi:idref="{0}"><source xmi:idref="{1}">'
+                '<model ea_localid="{2}" type="Class" name="{3}"/>'
+                '<role visibility="Public" targetScope="instance"/>'
+                '<type aggregation="none" containment="Unspecified"/>'
+                '</source><target xmi:idref="{4}"><model type="Class" '
+                'name="{5}"/><role visibility="Public" targetScope="instance"/>'
+                '<type aggregation="none" containment="Unspecified"/></target>'
+                '<model ea_localid="{6}"/><properties ea_type="Generalization" '
+                'direction="Source -&gt; Destination"/></connector>'.format(
+                    gid,
+                    cid,
+                    cn,
+                    c["name"],
+                    ids[c["general"]],
+                    c["general"],
+                    len(connectors),
+                )
+            )
+        out.append("</packagedElement>")
+        ext_elements.append(
+            '<element xmi:idref="{}" xmi:type="uml:Class" name="{}" '
+            'scope="public"><model package="EAPK_USDM" tpos="0" '
+            'ea_localid="{}" ea_eleType="element"/><properties '
+            'isSpecification="false" sType="Class" nType="0" scope="public" '
+            'isRoot="false" isLeaf="false" isAbstract="{}" isActive="false"/>'
+            '<project author="synthetic" version="1.0" phase="1.0" '
+            'created="2024-01-01 00:00:00" modified="2024-01-01 00:00:00" '
+            'complexity="1" status="Proposed"/><code gentype="Java"/>'
+            '<style appearance="BackColor=-1;BorderColor=-1;BorderWidth=-1;'
+            'FontColor=-1;VSwimLanes=1;HSwimLanes=1;BorderStyle=0;"/>'
+            '<tags/><xrefs/><extendedProperties tagged="0" '
+            'package_name="USDM"/><attributes>{}</attributes>'
+            "<links/></element>".format(
+                cid,
+                c["name"],
+                cn,
+                "true" if c["abstract"] else "false",
+                "".join(ext_attrs),
+            )
+        )
+        cn += 1
+    out.extend(assocs)
+    out.append("</packagedElement>")
+    out.append("</uml:Model>")
+    out.append('<xmi:Extension extender="Enterprise Architect" extenderID="6.5">')
+    out.append('<elements><element xmi:idref="EAPK_USDM" xmi:type="uml:Package" ')
+    out.append('name="USDM" scope="public"><model package2="EAID_USDM" ')
+    out.append('package="EAPK_ROOT" tpos="0" ea_localid="0" ea_eleType="package"/>')
+    out.append("</element>")
+    out.extend(ext_elements)
+    out.append("</elements>")
+    out.append("<connectors>")
+    out.extend(connectors)
+    out.append("</connectors>")
+    out.append("<primitivetypes/><profiles/><diagrams>")
+    out.append(
+        '<diagram xmi:id="EAID_DIAGRAM"><model package="EAPK_USDM" '
+        'localID="1" owner="EAPK_USDM"/><properties name="USDM" '
+        'type="Logical"/><project author="synthetic" version={} '
+        'created="2024-01-01 00:00:00" modified="2024-01-01 00:00:00"/>'
+        '<style1 value="ShowPrivate=1;ShowProtected=1;ShowPublic=1;"/>'
+        "<elements>".format(quoteattr(model["version"]))
+    )
+    for n, c in enumerate(model["classes"]):
+        out.append(
+            '<element geometry="Left={0};Top={0};Right={1};Bottom={1};" '
+            'subject="{2}" seqno="{3}" style="DUID=ABCD;"/>'.format(
+                n * 10, n * 10 + 100, ids[c["name"]], n
+            )
+        )
+    out.append("</elements></diagram></diagrams>")
+    out.append("</xmi:Extension>")
+    out.append("</xmi:XMI>")
+    with open(path, "w", encoding="windows-1252") as f:
+        f.write("\n".join(out))
+
+
+def write_ct(model: dict, path: str):
+    workbook = xlsxwriter.Workbook(path)
+    ws = workbook.add_worksheet("DDF Entities&Attributes")
+    ws.write_row(
+        0,
+        0,
+        [
+            "Entity Name",
+            "Role",
+            "Logical Data Model Name",
+            "NCI C-code",
+            "CT Item Preferred Name",
+            "Synonym(s)",
+            "Definition",
+            "Has Value List",
+        ],
+    )
+    row = 0
+    ccode = 100000
+    codelists = []
+    for c in model["classes"]:
+        row += 1
+        ccode += 1
+        ws.write_row(
+            row,
+            0,
+            [
+                c["name"],
+                "Entity",
+                c["name"],
+                "C{}".format(ccode),
+                " ".join(w.title() for w in c["name"].split()),
+                None,
+                "Definition of {}".format(c["name"]),
+                None,
+            ],
+        )
+        for n, (aname, _, _, _, _) in enumerate(c["attributes"]):
+            if c["name"].endswith("5") and n == len(c["attributes"]) - 1:
+                # Leave an attribute undefined in CT
+                continue
+            row += 1
+            ccode += 1
+            ws.write_row(
+                row,
+                0,
+                [
+                    c["name"],
+                    "Attribute",
+                    aname,
+                    "C{}".format(ccode),
+                    # Leave some preferred names blank to exercise fallbacks
+                    None if aname == "id" else "{} {}".format(c["name"], aname),
+                    None,
+                    "Definition of {}.{}".format(c["name"], aname),
+                    "N",
+                ],
+            )
+        if c["name"].endswith("7"):
+            # Add an attribute that is not defined in XMI
+            row += 1
+            ws.write_row(row, 0, [c["name"], "Attribute", "ctOnly", None, "CT Only"])
+        for n, (lname, tgt, _, _) in enumerate(c["links"]):
+            if c["name"].endswith("9") and n == len(c["links"]) - 1:
+                # Leave a relationship undefined in CT
+                continue
+            row += 1
+            ccode += 1
+            cref = "C{}".format(900000 + len(codelists)) if tgt == "Code" else None
+            if cref:
+                codelists.append(cref)
+            ws.write_row(
+                row,
+                0,
+                [
+                    c["name"],
+                    "Relationship",
+                    lname,
+                    "C{}".format(ccode),
+                    "{} {}".format(c["name"], lname),
+                    None,
+                    "Definition of {}.{}".format(c["name"], lname),
+                    "Y ({})".format(cref) if cref else "N",
+                ],
+            )
+    cl = workbook.add_worksheet("DDF valid value sets")
+    cl.write_row(
+        0,
+        0,
+        [
+            "Codelist C-Code",
+            "Codelist Name",
+            "Code",
+            "CDISC Submission Value",
+            "Preferred Term",
+            "Definition",
+        ],
+    )
+    row = 0
+    for cref in codelists:
+        for n in range(5):
+            row += 1
+            cl.write_row(
+                row,
+                0,
+                [
+                    cref,
+                    "Codelist {}".format(cref),
+                    "C{}".format(700000 + row),
+                    "VALUE {}".format(n),
+                    "Value {}".format(n),
+                    "Definition of value {}".format(n),
+                ],
+            )
+    workbook.close()
+
+
+def api_property(atype: str, lower: str, upper: str) -> dict:
+    if upper == "*":
+        return {"type": "array", "items": {"type": atype.lower()}}
+    elif lower == "0":
+        return {"anyOf": [{"type": atype.lower()}, {"type": "null"}]}
+    else:
+        return {"type": atype.lower()}
+
+
+def api_relationship(mult: str, contained: bool, ref: str) -> dict:
+    # Contained relationships are nested objects, others are id references.
+    if not contained:
+        return (
+            {"type": "array", "items": {"type": "string"}}
+            if mult.endswith("*")
+            else {"anyOf": [{"type": "string"}, {"type": "null"}]}
+        )
+    elif mult.endswith("*"):
+        return {"type": "array", "items": {"$ref": ref}}
+    elif mult.startswith("0"):
+        return {"anyOf": [{"$ref": ref}, {"type": "null"}]}
+    else:
+        return {"$ref": ref}
+
+
+def api_schemas(c: dict, model: dict, variant: str = None) -> dict:
+    def ref(name):
+        if variant and name not in ("Code", "AliasCode"):
+            return "#/components/schemas/{}-{}".format(name, variant)
+        return "#/components/schemas/{}".format(name)
+
+    classes = {x["name"]: x for x in model["classes"]}
+    props = {}
+    required = []
+    attrs = list(c["attributes"])
+    general = c["general"]
+    while general:
+        attrs += classes[general]["attributes"]
+        general = classes[general]["general"]
+    for aname, atype, lower, upper, _ in attrs:
+        if aname == "instanceType":
+            props[aname] = {"const": c["name"], "title": "Instancetype"}
+        else:
+            props[aname] = api_property(atype, lower, upper)
+        if lower == "1":
+            required.append(aname)
+    for lname, tgt, mult, contained in c["links"]:
+        if contained:
+            key = lname
+            if mult == "1":
+                required.append(lname)
+        else:
+            key = lname + ("Ids" if mult.endswith("*") else "Id")
+        props[key] = api_relationship(mult, contained, ref(tgt))
+    props["extensionAttributes"] = {"type": "array", "items": {"type": "string"}}
+    return {
+        "properties": props,
+        "required": required,
+        "title": c["name"],
+        "type": "object",
+    }
+
+
+def write_api(model: dict, path: str):
+    schemas = {}
+    for n, c in enumerate(model["classes"]):
+        if c["abstract"]:
+            continue
+        if any(x[3] for x in c["links"]) and c["name"] not in ("AliasCode",):
+            schemas[c["name"] + "-Input"] = api_schemas(c, model, "Input")
+            schemas[c["name"] + "-Output"] = api_schemas(c, model, "Output")
+            if n % 7 == 3:
+                schemas[c["name"] + "-Output"]["title"] = "Mismatch"
+        else:
+            schemas[c["name"]] = api_schemas(c, model)
+    spec = {
+        "openapi": "3.1.0",
+        "info": {"title": "Synthetic USDM API", "version": model["version"]},
+        "paths": {
+            "/v1/studyDefinitions": {
+                "post": {
+                    "summary": "Add a study definition",
+                    "responses": {"200": {"description": "Successful Response"}},
+                }
+            }
+        },
+        "components": {"schemas": schemas},
+    }
+    with open(path, "w") as f:
+        yaml.safe_dump(spec, f, sort_keys=False)
+
+
+def write_model(
+    output_dir: str,
+    classes: int = 40,
+    attributes: int = 6,
+    depth: int = 1,
+    fanout: int = 3,
+    cycles: int = 2,
+    seed: int = 1,
+) -> tuple:
+    # Writes the XMI, CT and API files of a synthetic model to the output
+    # directory and returns their paths.
+    os.makedirs(output_dir, exist_ok=True)
+    model = build_model(classes, attributes, depth, fanout, cycles, seed)
+    files = (
+        os.path.join(output_dir, "USDM_UML.xmi"),
+        os.path.join(output_dir, "USDM_CT.xlsx"),
+        os.path.join(output_dir, "USDM_API.yaml"),
+    )
+    write_xmi(model, files[0])
+    write_ct(model, files[1])
+    write_api(model, files[2])
+    return files
+
+
+def main():
+    args = parse_arguments()
+    write_model(
+        args.output_dir,
+        args.classes,
+        args.attributes,
+        args.depth,
+        args.fanout,
+        args.cycles,
+        args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from xmi_reader import UmlClass, XmiModel
+
+
+class ClassGraph:
+    # Graph of the classes of an XMI model, built once from its generalizations
+    # and connectors. Each class has an expansion plan listing, from its most
+    # general class down to itself, the attributes and relationships of each
+    # class together with the class whose CT entry describes them, and an edge
+    # to the target of each single cardinality relationship of the plan (the
+    # relationships that are expanded into columns). Cycles are identified by
+    # class rather than relationship name, as the strongly connected
+    # components of the graph.
+    def __init__(self, usdmxmi: XmiModel):
+        self.plans = {cls.id: self.build_plan(usdmxmi, cls) for cls in usdmxmi.classes}
+        self.edges = {
+            cls_id: [
+                lcls.id
+                for _, _, _, links in plan
+                for lnk, lcls in links
+                if lcls and lnk.multiplicity and lnk.multiplicity.endswith("1")
+            ]
+            for cls_id, plan in self.plans.items()
+        }
+        self.components = {}
+        self.find_components()
+
+    def build_plan(self, usdmxmi: XmiModel, cls: UmlClass) -> tuple:
+        # (class, CT entity name, (property, attribute) pairs, (relationship,
+        # target class) pairs) for each class of the hierarchy. The members of
+        # a general class are described by the CT entry of its specialization,
+        # and those of cls by the entity being expanded (None).
+        hierarchy = [(cls, None)]
+        while usdmxmi.get_general(hierarchy[-1][0]) and len(hierarchy) <= len(
+            usdmxmi.classes
+        ):
+            hierarchy.append(
+                (usdmxmi.get_general(hierarchy[-1][0]), hierarchy[-1][0].name)
+            )
+        return tuple(
+            (
+                vcls,
+                descName,
+                tuple(
+                    (prp, usdmxmi.get_attribute(prp))
+                    for prp in usdmxmi.get_properties(vcls)
+                ),
+                tuple(
+                    (lnk, usdmxmi.get_target(lnk)) for lnk in usdmxmi.get_links(vcls)
+                ),
+            )
+            for vcls, descName in reversed(hierarchy)
+        )
+
+    def find_components(self):
+        # Tarjan's algorithm, iterating rather than recursing so that long
+        # relationship chains do not exceed the recursion limit.
+        index = {}
+        lowlink = {}
+        stack = []
+        for root in self.edges:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            work = [(root, iter(self.edges[root]))]
+            while work:
+                node, targets = work[-1]
+                for target in targets:
+                    if target not in index:
+                        index[target] = lowlink[target] = len(index)
+                        stack.append(target)
+                        work.append((target, iter(self.edges[target])))
+                        break
+                    elif target not in self.components:
+                        lowlink[node] = min(lowlink[node], index[target])
+                else:
+                    work.pop()
+                    if work:
+                        lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        self.add_component(stack, stack.index(node))
+
+    def add_component(self, stack: list, start: int):
+        component = frozenset(stack[start:])
+        del stack[start:]
+        for cls_id in component:
+            self.components[cls_id] = component
+
+    def get_plan(self, cls: UmlClass) -> tuple:
+        return self.plans[cls.id]
+
+    def get_component(self, cls: UmlClass) -> frozenset:
+        # Ids of the classes from which cls is reachable and which are reachable
+        # from cls, i.e. those that may appear again below cls on a path.
+        return self.components[cls.id]
@@ -0,0 +1,44 @@
+class Column:
+    __slots__ = ("name", "description", "type", "cardinality")
+
+    def __init__(self, name: str, description: str, type: str, cardinality: str):
+        self.name = name
+        self.description = description
+        self.type = type
+        self.cardinality = cardinality
+
+    def __repr__(self) -> str:
+        return "Column({!r}, {!r}, {!r}, {!r})".format(
+            self.name, self.description, self.type, self.cardinality
+        )
+
+
+class ColumnSpec:
+    # The columns of an entity worksheet in insertion order, indexed by name
+    # so that columns can be looked up and updated in place.
+    __slots__ = ("columns", "index")
+
+    def __init__(self, columns: list = ()):
+        self.columns = []
+        self.index = {}
+        for column in columns:
+            self.add(*column)
+
+    def add(self, name: str, description: str, type: str, cardinality: str):
+        self.index.setdefault(name, len(self.columns))
+        self.columns.append(Column(name, description, type, cardinality))
+
+    def get(self, name: str) -> Column:
+        return self.columns[self.index[name]] if name in self.index else None
+
+    def to_list(self) -> list:
+        return [[x.name, x.description, x.type, x.cardinality] for x in self.columns]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self) -> int:
+        return len(self.columns)
@@ -1,11 +1,16 @@
 import argparse
-import re
-import yaml
-import openpyxl
-import xlsxwriter
-from bs4 import BeautifulSoup, Tag
-from copy import deepcopy
-import inflect
+import importlib.util
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from dataset_writer import DATASET_FORMATS
+from prefill import read_documents
+from profiler import Profiler
+from release import DELIVERABLES, find_deliverables
+from template_generator import TemplateGenerator
+from xmi_reader import read_xmi_version
 
 
 def parse_arguments():
@@ -15,30 +20,41 @@ def parse_arguments():
         Reads the Enterprise Architect XMI export file containing definition
         of the USDM UML model (specified in the -x option), the USDM
         Controlled Terminology Excel file (specified in the -c option), and the
-        USDM API specification in YAML format (specified in the -a option) and
+        USDM API specification in YAML or JSON format (specified in the -a
+        option), or locates them in a DDF release directory or zip archive
+        (specified in the -R option), and
         creates an Excel template file (optionally specified in the -o option)
-        for test data entry."""
+        for test data entry. Alternatively, templates for several USDM
+        versions can be created in one run from a manifest file (specified in
+        the -b option)."""
     )
     parser.add_argument(
         "-x",
         "--xmi_file",
         help="USDM XMI export file "
         + "(e.g.,<DDFversion>/Deliverables/UML/USDM_UML.xmi)",
-        required=True,
     )
     parser.add_argument(
         "-c",
         "--ct_file",
         help="USDM CT Excel file "
         + "(e.g., <DDF version>/Deliverables/CT/USDM_CT.xlsx)",
-        required=True,
     )
     parser.add_argument(
         "-a",
         "--api_spec",
-        help="USDM API specification YAML file. "
+        help="USDM API specification YAML or JSON file. "
         + "(e.g., <DDF version>/Deliverables/API/USDM_API.yaml)",
-        required=True,
+    )
+    parser.add_argument(
+        "-R",
+        "--release",
+        help="[Optional] DDF release directory or zip archive (e.g., as "
+        + "downloaded from GitHub) from which the XMI, CT and API files not "
+        + "specified in the -x, -c and -a options are read, at their "
+        + "conventional paths within the <DDF version> folder. Files in a zip "
+        + "archive are read without extracting them.",
+        default=None,
     )
     parser.add_argument(
         "-o",
@@ -48,631 +64,346 @@ def parse_arguments():
         + "(e.g., USDM_2.6_Test_Data_Template.xlsx)",
         default="USDM_<USDM version>_Test_Data_Template.xlsx",
     )
+    parser.add_argument(
+        "-k",
+        "--cache_dir",
+        help="[Optional] Directory in which to cache the model resolved from "
+        + "the XMI, CT and API files. The cache is keyed by the contents of "
+        + "the three files and is rebuilt whenever any of them changes.",
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="[Optional] Number of worker processes used to compute the "
+        + "entity worksheets, or to create the templates listed in the batch "
+        + "manifest. Default is 1 (no worker processes).",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        help="[Optional] Store a fingerprint of the inputs and the columns of "
+        + "each entity worksheet next to the output file, and only recompute "
+        + "the worksheets whose inputs changed since the previous run.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--sequential_load",
+        help="[Optional] Load the XMI, CT and API files one after another in the "
+        + "main process, rather than at the same time in three worker processes. "
+        + "Files are always loaded one after another if only one CPU is "
+        + "available.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-m",
+        "--max_depth",
+        help="[Optional] Maximum number of nested single cardinality "
+        + "relationships flattened into the columns of an entity worksheet. "
+        + "Relationships at that depth only have an [Exists] column. Default is "
+        + "no limit (relationships are expanded until they lead back to a class "
+        + "already on the path).",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        help="[Optional] YAML or JSON manifest listing the templates to create, "
+        + "each with xmi_file, ct_file, api_spec (or release) and optionally "
+        + "output_file, report_file and datasets_dir entries (relative to the "
+        + "manifest). Replaces the -x, -c, -a and -R options. The -o, -r, -D "
+        + "and -p options are used for the entries without their own, and "
+        + "must then contain <USDM version>. Entries may not write to the same "
+        + "files.",
+        default=None,
+    )
+    parser.add_argument(
+        "-r",
+        "--report_file",
+        help="[Optional] JSON file to which the diagnostics are written, with "
+        + "the kind, entity, attribute and number of occurrences of each. The "
+        + "name may contain <USDM version> (e.g., USDM_<USDM version>_Report.json)",
+        default=None,
+    )
+    parser.add_argument(
+        "-C",
+        "--check",
+        help="[Optional] Only check the consistency of the XMI, CT and API "
+        + "files, without creating a template. Exits with a non-zero status if "
+        + "any inconsistencies are found.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-P",
+        "--prefill",
+        help="[Optional] USDM JSON files whose studies are written as rows of "
+        + "the template, using constant memory, and of the dataset files.",
+        nargs="+",
+        default=None,
+    )
+    parser.add_argument(
+        "-D",
+        "--datasets_dir",
+        help="[Optional] Directory to which each entity worksheet and value "
+        + "sheet is also written as a dataset file, together with a "
+        + "datasets.json manifest listing the datasets and their variables. The "
+        + "name may contain <USDM version>.",
+        default=None,
+    )
+    parser.add_argument(
+        "-F",
+        "--datasets_format",
+        help="[Optional] Format of the dataset files: xpt (SAS V5 transport, "
+        + "default), csv or parquet (requires pyarrow).",
+        choices=DATASET_FORMATS,
+        default="xpt",
+    )
+    parser.add_argument(
+        "--datasets_only",
+        help="[Optional] Only write the dataset files, without creating the Excel "
+        + "template.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        help="[Optional] File to which the wall time and peak resident memory "
+        + "of each phase, and the time, recursion depth, column count and lookups of "
+        + "each entity worksheet are written. The name may contain "
+        + "<USDM version>. Entity worksheets are then computed in the main "
+        + "process.",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile_format",
+        help="[Optional] Format of the profile file: json (default) or chrome "
+        + "(Chrome trace format, as read by chrome://tracing or Perfetto).",
+        choices=("json", "chrome"),
+        default="json",
+    )
+    parser.add_argument(
+        "--profile_memory",
+        help="[Optional] Also trace the peak memory allocated by Python during "
+        + "each phase in the profile file, which considerably slows down the run.",
+        action="store_true",
+    )
     args = parser.parse_args()
+    if args.batch:
+        check_batch_arguments(parser, args)
+        try:
+            args.versions = read_manifest(args)
+            check_outputs(args.batch, args.versions)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    elif not args.release:
+        missing = [
+            opt
+            for opt, val in (
+                ("-x/--xmi_file", args.xmi_file),
+                ("-c/--ct_file", args.ct_file),
+                ("-a/--api_spec", args.api_spec),
+            )
+            if not val
+        ]
+        if missing:
+            parser.error("the following arguments are required: " + ", ".join(missing))
+    if args.datasets_only and not args.datasets_dir:
+        parser.error("--datasets_only requires -D/--datasets_dir")
+    if args.datasets_format == "parquet" and not importlib.util.find_spec("pyarrow"):
+        parser.error("-F parquet requires pyarrow, which is not installed")
     return args
 
 
-def replace_deep(data, a, b):
-    if isinstance(data, str):
-        return data.replace(a, b)
-    elif isinstance(data, dict):
-        return {k: replace_deep(v, a, b) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [replace_deep(v, a, b) for v in data]
-    else:
-        return data
-
-
-def get_api_desc(prp: str, prpDict: dict) -> str:
-    if "type" in prpDict and prpDict["type"] == "array":
-        return name_to_desc(prp) + " [Any Exist]"
-    elif "$ref" in prpDict or (
-        "anyOf" in prpDict and any("$ref" in x for x in prpDict["anyOf"])
+def check_batch_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    # The input files are given by the manifest entries, while the output file
+    # names are used by every entry that does not give its own, so they must
+    # differ between USDM versions.
+    for opt, val in (
+        ("-x/--xmi_file", args.xmi_file),
+        ("-c/--ct_file", args.ct_file),
+        ("-a/--api_spec", args.api_spec),
+        ("-R/--release", args.release),
     ):
-        return name_to_desc(prp) + " [Exists]"
-    else:
-        return name_to_desc(prp)
-
-
-def get_api_type(prpDict: dict) -> str:
-    if (
-        ("type" in prpDict and prpDict["type"] == "array")
-        or "$ref" in prpDict
-        or ("anyOf" in prpDict and any("$ref" in x for x in prpDict["anyOf"]))
-    ):
-        return "Boolean"
-    elif "const" in prpDict:
-        return "String"
-    elif "type" in prpDict:
-        return prpDict["type"].title()
-    elif "anyOf" in prpDict:
-        return "".join(
-            x["type"].title()
-            for x in prpDict["anyOf"]
-            if "type" in x and x["type"] != "'null'"
-        )
-    else:
-        return "!!UNKNOWN API TYPE!!"
-
-
-def get_properties(
-    entName: str, cls: Tag, prps: list, prefix: list = None, lclsName: str = None
-):
-    if cls.generalization:
-        gclsId = cls.generalization["general"]
-        gcls = usdmxmi.find("packagedElement", attrs={"xmi:id": gclsId})
-        get_properties(entName, gcls, prps, prefix, cls["name"])
-    for prp in (
-        x
-        for x in cls.find_all("ownedAttribute", attrs={"xmi:type": "uml:Property"})
-        if x.has_attr("name")
+        if val:
+            parser.error(f"argument {opt} not allowed with argument -b/--batch")
+    for opt, val in (
+        ("-o/--output_file", args.output_file),
+        ("-r/--report_file", args.report_file),
+        ("-D/--datasets_dir", args.datasets_dir),
+        ("-p/--profile", args.profile),
     ):
-        attr = usdmxmi.find("attribute", attrs={"xmi:idref": str(prp["xmi:id"])})
-        prps[0] += [".".join((prefix[0], prp["name"])) if prefix else prp["name"]]
-        prps[1] += [
-            (
-                " / ".join(
-                    (prefix[1], get_description(lclsName or entName, prp["name"]))
-                )
-                if prefix
-                else get_description(lclsName or entName, prp["name"])
-            )
-            + ""
-            if attr.bounds["upper"] == "1"
-            else " [Any Exist]"
-        ]
-        prps[2] += [
-            attr.properties["type"] if attr.bounds["upper"] == "1" else "Boolean"
-        ]
-        prps[3] += [
-            "{}.{}{}".format(prefix[2], prp["name"], get_card(attr.bounds))
-            if prefix
-            else get_card(attr.bounds)
-        ]
-    if not prefix and cls["name"] == entName:
-        for prp in (
-            x
-            for x in apidict[entName].keys()
-            if x != "id"
-            and x not in entdict[entName]["Properties"]
-            and not any(
-                k
-                for k, v in entdict[entName]["Properties"].items()
-                if v["apiattr"] == x
-            )
+        if val and "<USDM version>" not in val:
+            parser.error(f"argument {opt} must contain <USDM version> with -b/--batch")
+
+
+def read_manifest(batch_args: argparse.Namespace) -> list:
+    import yaml
+
+    with open(batch_args.batch, "r") as f:
+        manifest = yaml.safe_load(f)
+    mdir = os.path.dirname(batch_args.batch)
+    versions = []
+    for n, entry in enumerate(manifest, 1):
+        version = argparse.Namespace(**vars(batch_args))
+        version.batch = None
+        for opt in (
+            "release",
+            "xmi_file",
+            "ct_file",
+            "api_spec",
+            "output_file",
+            "report_file",
+            "datasets_dir",
         ):
-            prps[0] += [prp]
-            prps[1] += [get_api_desc(prp, apidict[entName][prp])]
-            prps[2] += [get_api_type(apidict[entName][prp])]
-            prps[3] += ["[1]" if apidict[entName][prp]["required"] is True else "[0]"]
-            print(
-                (
-                    "API-only attribute "
-                    + f"'{entName}.{prp}' added from {args.api_spec}"
-                )
-            )
-
-    for lnk in (
-        x.find_parent("connector")
-        for x in usdmxmi.find_all("source", attrs={"xmi:idref": cls["xmi:id"]})
-        if x.find_parent("connector").has_attr("name")
-    ):
-        if lnk["name"] in entdict[lclsName if prefix else entName]["Properties"]:
-            lcls = usdmxmi.find(
-                "packagedElement", attrs={"xmi:id": lnk.target["xmi:idref"]}
-            )
-            if prefix:
-                lnkName = ".".join((prefix[0], lnk["name"]))
-                lnkDesc = " / ".join(
-                    (
-                        prefix[1],
-                        get_description(lclsName or entName, lnk["name"]),
-                    )
+            if opt in entry:
+                setattr(version, opt, os.path.join(mdir, entry[opt]))
+            elif opt == "release" or opt in DELIVERABLES and "release" in entry:
+                setattr(version, opt, None)
+            elif opt in DELIVERABLES:
+                raise ValueError(
+                    f"Entry {n} of {batch_args.batch} does not specify {opt}"
                 )
-                lnkCard = ">".join(
-                    (
-                        prefix[2],
-                        "{}[{}]".format(
-                            lcls["name"],
-                            lnk.target.type["multiplicity"],
-                        ),
-                    )
-                )
-            else:
-                lnkName = lnk["name"]
-                lnkDesc = get_description(lclsName or entName, lnk["name"])
-                lnkCard = "{}[{}]".format(lcls["name"], lnk.target.type["multiplicity"])
-            apiattr = (
-                entdict[lclsName if prefix else entName]["Properties"][lnk["name"]][
-                    "apiattr"
-                ]
-                if "apiattr"
-                in entdict[lclsName if prefix else entName]["Properties"][lnk["name"]]
-                else None
-            )
-            single_lnk = lnk.target.type["multiplicity"].endswith("1")
-            if apiattr is None or apiattr == lnk["name"]:
-                isCircular: bool = False
-                if prefix and lnk["name"] in prefix[0].split("."):
-                    isCircular = True
-                    print(
-                        f"Circular relationship found: {lnk['name']} found in "
-                        + prefix[0]
-                    )
-                else:
-                    prps[0] += [lnkName]
-                    prps[1] += [
-                        lnkDesc + (" [Exists]" if single_lnk else " [Any Exists]")
-                    ]
-                    prps[2] += ["Boolean"]
-                    prps[3] += [lnkCard]
-                if single_lnk and not isCircular:
-                    get_properties(
-                        entName,
-                        lcls,
-                        prps,
-                        [
-                            lnkName,
-                            lnkDesc,
-                            lnkCard,
-                        ],
-                        lcls["name"],
-                    )
-            else:
-                if (".".join((prefix[0], apiattr)) if prefix else apiattr) in prps[0]:
-                    prps[3][
-                        prps[0].index(
-                            ".".join((prefix[0], apiattr)) if prefix else apiattr
-                        )
-                    ] += " / {}".format(
-                        ">".join(
-                            (
-                                prefix[2],
-                                "{}[{}].id[1]".format(
-                                    lnk.target.model["name"],
-                                    lnk.target.type["multiplicity"],
-                                ),
-                            )
-                        )
-                        if prefix
-                        else "{}[{}].id[1]".format(
-                            lnk.target.model["name"], lnk.target.type["multiplicity"]
-                        )
-                    )
-                else:
-                    prps[0] += [".".join((prefix[0], apiattr)) if prefix else apiattr]
-                    prps[1] += [
-                        "{} [{}]".format(
-                            " / ".join(
-                                (
-                                    prefix[1],
-                                    get_description(lclsName or entName, lnk["name"]),
-                                )
-                            )
-                            if prefix
-                            else get_description(lclsName or entName, lnk["name"]),
-                            "Identifier" if single_lnk else "Identifiers][Any Exist",
-                        )
-                    ]
-                    prps[2] += ["String" if single_lnk else "Boolean"]
-                    prps[3] += [
-                        ">".join(
-                            (
-                                prefix[2],
-                                "{}[{}].id[1]".format(
-                                    lnk.target.model["name"],
-                                    lnk.target.type["multiplicity"],
-                                ),
-                            )
-                        )
-                        if prefix
-                        else "{}[{}].id[1]".format(
-                            lnk.target.model["name"], lnk.target.type["multiplicity"]
-                        )
-                    ]
-        elif not prefix:
-            print(
-                f"Relationship '{entName}.{lnk['name']}' defined in {args.xmi_file} "
-                + f"does not have a matching entry in {args.ct_file}"
-            )
-
+        versions.append(version)
+    return versions
+
+
+def get_outputs(version: argparse.Namespace) -> list:
+    # The files and directories written for a manifest entry.
+    return [
+        path
+        for path, written in (
+            (version.output_file, not version.check and not version.datasets_only),
+            (version.datasets_dir, not version.check),
+            (version.report_file, True),
+            (version.profile, True),
+        )
+        if path and written
+    ]
 
-def get_description(entName: str, prpName: str = None) -> str:
-    if (
-        prpName in entdict[entName]["Properties"]
-        and entdict[entName]["Properties"][prpName]["Preferred Name"]
-    ):
-        return entdict[entName]["Properties"][prpName]["Preferred Name"]
-    else:
-        if not (prpName in entdict[entName]["Properties"] or prpName == "id"):
-            print(
-                f"No entry found in {args.ct_file} for USDM "
-                + f"attribute '{entName}.{prpName}'"
-            )
-        return "({} {})".format(name_to_desc(entName), name_to_desc(prpName))
 
+def check_outputs(batch: str, versions: list):
+    # Rejects manifests whose entries would write to the same file or
+    # directory, as when they are of the same USDM version.
+    written = {}
+    for n, version in enumerate(versions, 1):
+        outputs = get_outputs(version)
+        if any("<USDM version>" in x for x in outputs):
+            usdmver = read_xmi_version(get_input_files(version)[0])
+            outputs = [x.replace("<USDM version>", str(usdmver)) for x in outputs]
+        for path in outputs:
+            path = os.path.abspath(path)
+            if path in written:
+                raise ValueError(
+                    f"Entries {written[path]} and {n} of {batch} both write {path}"
+                )
+            written[path] = n
 
-def name_to_desc(name: str) -> str:
-    return re.sub("([A-Z]+)", r" \1", name).strip().title()
 
+def get_input_files(gen_args: argparse.Namespace) -> tuple:
+    # The XMI, CT and API files, those not given being located in the release.
+    files = find_deliverables(gen_args.release) if gen_args.release else {}
+    return tuple(getattr(gen_args, opt) or files[opt] for opt in DELIVERABLES)
 
-def get_card(bounds: Tag) -> str:
-    if bounds["lower"] == bounds["upper"]:
-        return "[{}]".format(bounds["lower"])
-    else:
-        return "[{}..{}]".format(bounds["lower"], bounds["upper"])
 
-
-def get_apiattr(entName: str, elname: str, elrole: str) -> str:
-    if elname in apidict[entName]:
-        return elname
+def generate(gen_args: argparse.Namespace) -> int:
+    # Returns the number of inconsistencies found in check mode.
+    profiler = Profiler(gen_args.profile_memory) if gen_args.profile else None
+    generator = TemplateGenerator(
+        *get_input_files(gen_args),
+        cache_dir=gen_args.cache_dir,
+        profiler=profiler,
+        max_depth=gen_args.max_depth,
+        sequential_load=gen_args.sequential_load,
+    )
+    if gen_args.check:
+        findings = len(generator.check())
     else:
-        if elrole == "Attribute":
-            print(f"No entry found in {args.api_spec} for '{entName}.{elname}'")
-            return None
+        documents = read_documents(gen_args.prefill) if gen_args.prefill else ()
+        if gen_args.datasets_only:
+            generator.write_datasets(
+                gen_args.datasets_dir,
+                gen_args.datasets_format,
+                gen_args.jobs,
+                documents=documents,
+            )
         else:
-            elprts = re.findall(r"([A-Z]?[a-z]+)", elname.strip())
-            if (
-                inflect.singular_noun(elprts[-1]) is False
-                or inflect.singular_noun(elprts[-1]) == elprts[-1]
-            ):
-                if elname + "Id" in apidict[entName]:
-                    return elname + "Id"
-                elif (
-                    inflect.singular_noun(elprts[-1]) == elprts[-1]
-                    and elname + "Ids" in apidict[entName]
-                ):
-                    return elname + "Ids"
-                else:
-                    print(
-                        f"No entry found in {args.api_spec} for '{entName}."
-                        + f"{elname}' or '{entName}.{elname}Id'"
-                    )
-            else:
-                if len(elprts) == 1:
-                    if inflect.singular_noun(elname) + "Ids" in apidict[entName]:
-                        return inflect.singular_noun(elname) + "Ids"
-                    elif elname + "Ids" in apidict[entName]:
-                        print(
-                            f"Using '{entName}.{elname}Ids' instead of "
-                            + f"'{entName}.{inflect.singular_noun(elname)}Ids' "
-                            + "for API attribute"
-                        )
-                        return elname + "Ids"
-                    else:
-                        print(
-                            f"No entry found in {args.api_spec} for "
-                            + f"'{entName}.{elname}', '{entName}."
-                            + f"{inflect.singular_noun(elname)}Ids' or "
-                            + f"'{entName}.{elname}Ids'"
-                        )
-                        return None
-                else:
-                    if (
-                        "".join(elprts[:-1]) + inflect.singular_noun(elprts[-1]) + "Ids"
-                        in apidict[entName]
-                    ):
-                        return (
-                            "".join(elprts[:-1])
-                            + inflect.singular_noun(elprts[-1])
-                            + "Ids"
-                        )
-                    elif elname + "Ids" in apidict[entName]:
-                        print(
-                            f"Using '{entName}.{elname}Ids' instead of "
-                            + f"'{entName}."
-                            + "".join(elprts[:-1])
-                            + inflect.singular_noun(elprts[-1])
-                            + "Ids' for API attribute"
-                        )
-                        return elname + "Ids"
-                    else:
-                        print(
-                            f"No entry found in {args.api_spec} for '{entName}."
-                            + f"{elname}', '{entName}."
-                            + "".join(elprts[:-1])
-                            + inflect.singular_noun(elprts[-1])
-                            + f"Ids' or '{entName}.{elname}Ids'"
-                        )
-                        return None
-
-
-args = parse_arguments()
-
-with open(args.xmi_file) as f:
-    xmidata = f.read()
-
-usdmxmi = BeautifulSoup(xmidata, "lxml-xml")
-
-with open(args.api_spec, "r") as f:
-    apispec = yaml.safe_load(f)
-
-apidict = {}
-
-for k, v in apispec["components"]["schemas"].items():
-    if "-" in k:
-        if k.endswith("-Input"):
-            cname = "".join(k.split("-")[:1])
-            if cname + "-Output" in apispec["components"]["schemas"]:
-                vo = apispec["components"]["schemas"][cname + "-Output"]
-                if v != replace_deep(
-                    vo,
-                    "Output",
-                    "Input",
-                ):
-                    print(f"API Input/Output definitions do not match for {cname}")
-                    print(f"{cname}-Input : {v}")
-                    print(f"{cname}-Output: {vo}")
-            else:
-                print(f"No corresponding API Output definition for {k}")
-    else:
-        cname = k
-
-    apidict[cname] = deepcopy(v["properties"])
-    for apiattn, apiattv in apidict[cname].items():
-        apiattv["required"] = "required" in v and apiattn in v["required"]
-
-inflect = inflect.engine()
-inflect.defnoun("previous", "previous")
-inflect.defnoun("context", "context")
-inflect.defnoun("to", "to")
-inflect.defnoun("of", "of")
-
-entdict = {}
-
-ctwb = openpyxl.load_workbook(filename=args.ct_file, data_only=True)
-
-ctws = ctwb["DDF Entities&Attributes"]
-
-ctcolmap = {ctcol.value: ctcol.column - 1 for ctcol in tuple(ctws.rows)[0]}
-
-for ctrow in ctws.iter_rows(min_row=2):
-    entName = ctrow[ctcolmap["Entity Name"]].value
-    elrole = ctrow[ctcolmap["Role"]].value
-    elname = ctrow[ctcolmap["Logical Data Model Name"]].value
-    if elrole == "Entity":
-        if elname != entName:
-            print(
-                f"Entity Name '{entName}' does not match Logical Data Model "
-                + f"Name for Entity '{elname}'"
+            generator.write(
+                gen_args.output_file,
+                gen_args.jobs,
+                gen_args.incremental,
+                documents,
+                gen_args.datasets_dir,
+                gen_args.datasets_format,
             )
-        entdict[entName] = {
-            "NCI C-code": ctrow[ctcolmap["NCI C-code"]].value,
-            "Preferred Name": ctrow[ctcolmap["CT Item Preferred Name"]].value,
-            "Definition": ctrow[ctcolmap["Definition"]].value,
-            "Properties": {},
-        }
-    else:
-        cref: str = None
-        cref = re.search(
-            r"^Y \((.+?)\)$", str(ctrow[ctcolmap["Has Value List"]].value).strip()
+        findings = 0
+    print(generator.diagnostics.get_summary(generator.files), end="")
+    if gen_args.report_file:
+        generator.diagnostics.write_report(
+            gen_args.report_file.replace("<USDM version>", generator.usdmver),
+            generator.files,
         )
-
-        entdict[entName]["Properties"][elname] = {
-            "name": elname,
-            "Role": elrole,
-            "NCI C-code": ctrow[ctcolmap["NCI C-code"]].value,
-            "Preferred Name": ctrow[ctcolmap["CT Item Preferred Name"]].value,
-            "Definition": ctrow[ctcolmap["CT Item Preferred Name"]].value,
-            "CodelistRef": cref.group(1) if cref else None,
-        }
-
-for entName, entDef in entdict.items():
-    cls = usdmxmi.find(
-        "packagedElement", attrs={"xmi:type": "uml:Class", "name": entName}
-    )
-    if cls.generalization:
-        gclsName = usdmxmi.find(
-            "packagedElement",
-            attrs={
-                "xmi:type": "uml:Class",
-                "xmi:id": cls.generalization["general"],
-            },
-        )["name"]
-        if gclsName in entdict:
-            for gprp in entdict[gclsName]["Properties"].keys():
-                if gprp not in entDef["Properties"]:
-                    entDef["Properties"][gprp] = deepcopy(
-                        entdict[gclsName]["Properties"][gprp]
-                    )
-                    print(
-                        f"Using general '{gclsName}.{gprp}' "
-                        + entDef["Properties"][gprp]["Role"].lower()
-                        + f" in '{entName}' specialization"
-                    )
-    if entName in apidict:
-        for prpName, prpDef in entDef["Properties"].items():
-            prpDef["apiattr"] = get_apiattr(entName, prpName, prpDef["Role"])
-
-for abscls in (
-    x["name"]
-    for x in usdmxmi.find_all("element", attrs={"xmi:type": "uml:Class"})
-    if x.properties["isAbstract"] == "true" or x["name"] not in apidict
-):
-    if abscls in entdict:
-        entdict.pop(abscls)
-        print(f"Excluding abstract class '{abscls}'")
-    else:
-        print(f"Abstract class {abscls} not found in {args.ct_file}")
-
-for clsName, clsDef in apidict.items():
-    if clsName not in entdict:
-        print(
-            f"No entry found in {args.ct_file} for API class '{clsName}' from "
-            + args.api_spec
+    if gen_args.check:
+        print(f"{findings} inconsistencies found")
+    if profiler:
+        profiler.close()
+        profiler.write(
+            gen_args.profile.replace("<USDM version>", generator.usdmver),
+            gen_args.profile_format,
         )
+    return findings
+
+
+def generate_version(gen_args: argparse.Namespace) -> tuple:
+    messages = io.StringIO()
+    with redirect_stdout(messages):
+        findings = generate(gen_args)
+    return messages.getvalue(), findings
+
+
+def get_version_title(version: argparse.Namespace) -> str:
+    if version.check:
+        return f"Checking {version.xmi_file or version.release}"
+    return f"Creating template from {version.xmi_file or version.release}"
+
+
+def generate_batch(batch_args: argparse.Namespace) -> int:
+    findings = 0
+    versions = batch_args.versions
+    if batch_args.jobs > 1 and len(versions) > 1:
+        # Versions are independent of each other, so each is created by one
+        # worker process rather than splitting entities or loaders over worker
+        # processes.
+        for version in versions:
+            version.jobs = 1
+            version.sequential_load = True
+        with ProcessPoolExecutor(
+            max_workers=min(batch_args.jobs, len(versions))
+        ) as pool:
+            for version, (messages, vfindings) in zip(
+                versions, pool.map(generate_version, versions)
+            ):
+                print(get_version_title(version))
+                print(messages, end="")
+                findings += vfindings
     else:
-        for prp in (
-            x
-            for x in clsDef.keys()
-            if x != "id"
-            and x not in entdict[clsName]["Properties"]
-            and not any(
-                k
-                for k, v in entdict[clsName]["Properties"].items()
-                if v["apiattr"] == x
-            )
-        ):
-            print(
-                (
-                    f"No corresponding entry found in {args.ct_file} for API attribute "
-                    + f"'{clsName}.{prp}' from {args.api_spec}"
-                )
-            )
-
-usdmver = (
-    usdmxmi.find("properties", {"name": "USDM", "type": "Logical"})
-    .find_parent("diagram")
-    .project["version"]
-)
-
-workbook = xlsxwriter.Workbook(args.output_file.replace("<USDM version>", usdmver))
-workbook.set_custom_property("USDM Version", str(usdmver))
-
-header = workbook.add_format()
-header.set_bold()
-header.set_align("top")
-header.set_text_wrap()
-
-sub_header = workbook.add_format()
-sub_header.set_italic()
-sub_header.set_bg_color("#FFFFCC")
-sub_header.set_text_wrap()
-sub_header.set_align("top")
-
-normal = workbook.add_format()
-normal.set_align("top")
-normal.set_num_format("@")
+        for version in versions:
+            print(get_version_title(version))
+            findings += generate(version)
+    return findings
 
-dsws = workbook.add_worksheet("Datasets")
-dsprps = ["Filename", "Dataset Name", "Label"]
-dsws.set_column(0, len(dsprps), 30)
-dsws.write_row(0, 0, dsprps, header)
 
-clsn = 0
-
-for entName in entdict.keys():
-    cls = usdmxmi.find(
-        "packagedElement", attrs={"xmi:type": "uml:Class", "name": entName}
-    )
-    if cls:
-        clsn += 1
-        clsSheet = entName + ".xpt" if len(entName) <= 27 else entName[:27] + ".xpt"
-        dsws.write_url(clsn, 0, f"internal:'{clsSheet}'!A1", string=clsSheet)
-        dsws.write_row(clsn, 1, [entName, entdict[entName]["Preferred Name"]])
-        ws = workbook.add_worksheet(clsSheet)
-        prps = [[], [], [], []]
-        get_properties(entName, cls, prps)
-        for prpv in (
-            v
-            for k, v in entdict[entName]["Properties"].items()
-            if not (
-                cls.find(
-                    "ownedAttribute", attrs={"xmi:type": "uml:Property", "name": k}
-                )
-                or any(
-                    x
-                    for x in usdmxmi.find_all(
-                        "source", attrs={"xmi:idref": cls["xmi:id"]}
-                    )
-                    if x.find_parent("connector").has_attr("name")
-                    and x.find_parent("connector")["name"] == k
-                )
-                or (
-                    cls.generalization
-                    and (
-                        usdmxmi.find(
-                            "packagedElement",
-                            attrs={
-                                "xmi:type": "uml:Class",
-                                "xmi:id": cls.generalization["general"],
-                            },
-                        ).find(
-                            "ownedAttribute",
-                            attrs={"xmi:type": "uml:Property", "name": k},
-                        )
-                        or any(
-                            x
-                            for x in usdmxmi.find_all(
-                                "source",
-                                attrs={"xmi:idref": cls.generalization["general"]},
-                            )
-                            if x.find_parent("connector").has_attr("name")
-                            and x.find_parent("connector")["name"] == k
-                        )
-                    )
-                )
-            )
-        ):
-            print(
-                f"{prpv['Role']} '{entName}.{prpv['name']}' defined in {args.ct_file} "
-                + "does not have a matching attribute or relationship in "
-                + args.xmi_file
-            )
-        prps[0] = ["parent_entity", "parent_id", "parent_rel", "rel_type"] + prps[0]
-        prps[1] = [
-            "Parent Entity Name",
-            "Parent Entity Id",
-            "Name of Relationship from Parent Entity",
-            "Type of Relationship",
-        ] + prps[1]
-        prps[2] = ["String", "String", "String", "String"] + prps[2]
-        prps[3] = ["[1]", "[1]", "[1]", "[1]"] + prps[3]
-        ws.set_column(0, len(prps[0]), 25)
-        ws.write_row(0, 0, prps[0], header)
-        ws.write_row(1, 0, prps[1], sub_header)
-        ws.write_row(2, 0, prps[2], sub_header)
-        ws.write_row(3, 0, prps[3], sub_header)
-        # Add a blank row with defined format to prevent auto-copying of format
-        # from row above.
-        ws.write_row(4, 0, [None] * len(prps[0]), normal)
+def main():
+    batch_args = parse_arguments()
+    if batch_args.batch:
+        findings = generate_batch(batch_args)
     else:
-        print(
-            f"Entity '{entName}' defined in {args.ct_file} does not have a "
-            + f"matching class in {args.xmi_file}"
-        )
+        findings = generate(batch_args)
+    if findings:
+        sys.exit(1)
 
-for cls in (
-    x
-    for x in usdmxmi.find_all("packagedElement", attrs={"xmi:type": "uml:Class"})
-    if x["name"] not in entdict
-    and usdmxmi.find("element", attrs={"xmi:idref": x["xmi:id"]}).properties[
-        "isAbstract"
-    ]
-    == "false"
-    and x["name"] in apidict
-):
-    print(
-        f"USDM class '{cls['name']}' defined in {args.xmi_file} does not "
-        + f"have a matching Entity in {args.ct_file}"
-    )
-
-for pdtype in ["String", "Float", "Boolean", "Null"]:
-    clsn += 1
-    dsname = pdtype.lower()
-    dsws.write_url(clsn, 0, f"internal:'{dsname}.xpt'!A1", string=f"{dsname}.xpt")
-    dsws.write_row(clsn, 1, [dsname, f"{pdtype} Values"])
-    ws = workbook.add_worksheet(f"{dsname}.xpt")
-    ws.set_column(0, 4, 25)
-    ws.write_row(
-        0, 0, ["parent_entity", "parent_id", "parent_rel", "rel_type", "value"], header
-    )
-    ws.write_row(
-        1,
-        0,
-        [
-            "Parent Entity Name",
-            "Parent Entity Id",
-            "Name of Relationship from Parent Entity",
-            "Type of Relationship",
-            "Value",
-        ],
-        sub_header,
-    )
-    ws.write_row(2, 0, ["String"] * 5, sub_header)
-    ws.write_row(3, 0, ["[1]"] * 4 + ["[0]" if pdtype == "Null" else "[1]"], sub_header)
-    # Add a blank row with defined format to prevent auto-copying of format
-    # from row above.
-    ws.write_row(4, 0, [None] * 5, normal)
 
-workbook.close()
+if __name__ == "__main__":
+    main()
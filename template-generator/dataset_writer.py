@@ -0,0 +1,279 @@
+import csv
+import math
+import os
+import re
+import struct
+import time
+from itertools import islice
+from column_spec import ColumnSpec
+from template_reader import to_value
+
+# Formats of the dataset files, which are also their extensions.
+DATASET_FORMATS = ("xpt", "csv", "parquet")
+
+NUMERIC_TYPES = ("Integer", "Float", "Number")
+
+XPT_MONTHS = (
+    "JAN",
+    "FEB",
+    "MAR",
+    "APR",
+    "MAY",
+    "JUN",
+    "JUL",
+    "AUG",
+    "SEP",
+    "OCT",
+    "NOV",
+    "DEC",
+)
+
+XPT_HEADER = "HEADER RECORD*******{:8}HEADER RECORD!!!!!!!{:30}  "
+
+# Number of rows converted and written to a Parquet file at a time.
+PARQUET_BATCH_ROWS = 10000
+
+
+def is_numeric(type: str) -> bool:
+    return any(x in type for x in NUMERIC_TYPES)
+
+
+def get_xpt_names(names: list) -> list:
+    # SAS V5 transport names have at most 8 letters, digits or underscores, so
+    # longer names are truncated and made unique with a numeric suffix.
+    xpt_names = []
+    used = set()
+    for name in names:
+        base = re.sub(r"\W", "_", name, flags=re.ASCII)[:8] or "_"
+        if base[0].isdigit():
+            base = ("_" + base)[:8]
+        xpt_name, n = base, 1
+        while xpt_name.upper() in used:
+            n += 1
+            xpt_name = base[: 8 - len(str(n))] + str(n)
+        used.add(xpt_name.upper())
+        xpt_names.append(xpt_name)
+    return xpt_names
+
+
+def ibm_float(value: float) -> bytes:
+    # Converts to the IBM hexadecimal floating point representation used by
+    # SAS V5 transport files, with a missing value for None.
+    if value is None or math.isnan(value):
+        return b"." + b"\0" * 7
+    if value == 0:
+        return b"\0" * 8
+    sign = 0x80 if value < 0 else 0
+    mantissa, exponent = math.frexp(abs(value))
+    hexponent = -(-exponent // 4)
+    fraction = int(mantissa * 2 ** (56 + exponent - 4 * hexponent))
+    if not 0 <= hexponent + 64 < 128:
+        raise OverflowError(f"{value} cannot be represented in a transport file")
+    return struct.pack(">Q", (sign | (hexponent + 64)) << 56 | fraction)
+
+
+def get_typed_value(value, type: str):
+    # Returns the value converted to the type of its column, or None if it
+    # cannot be converted.
+    value = to_value(value, type)
+    if "Boolean" in type or value is None:
+        return value
+    elif "Integer" in type:
+        return value if isinstance(value, int) else None
+    elif is_numeric(type):
+        return value if isinstance(value, float) else None
+    else:
+        return value
+
+
+def get_xpt_datetime() -> str:
+    t = time.localtime()
+    return "{:02d}{}{:02d}:{:02d}:{:02d}:{:02d}".format(
+        t.tm_mday,
+        XPT_MONTHS[t.tm_mon - 1],
+        t.tm_year % 100,
+        t.tm_hour,
+        t.tm_min,
+        t.tm_sec,
+    )
+
+
+def get_xpt_text(value) -> bytes:
+    # Character values are encoded in UTF-8 and truncated to 200 bytes on a
+    # character boundary.
+    text = str(to_value(value, "String") or "").encode("utf-8")
+    if len(text) > 200:
+        text = text[:200].decode("utf-8", "ignore").encode("utf-8")
+    return text
+
+
+def get_xpt_values(row: list, numeric: list) -> list:
+    return [
+        (
+            get_typed_value(row[i] if i < len(row) else None, "Float")
+            if numeric[i]
+            else get_xpt_text(row[i] if i < len(row) else None)
+        )
+        for i in range(len(numeric))
+    ]
+
+
+def write_xpt(path: str, name: str, label: str, columns: ColumnSpec, rows):
+    # Writes a SAS V5 transport file with one member. Character variables are
+    # as long as their longest value (at most 200 bytes), so the rows are read
+    # twice, first for the lengths and then to write them, and one-shot
+    # iterators are buffered.
+    if iter(rows) is rows:
+        rows = list(rows)
+    numeric = [is_numeric(col.type) for col in columns]
+    lengths = [8 if x else 1 for x in numeric]
+    for row in rows:
+        for i, value in enumerate(get_xpt_values(row, numeric)):
+            if not numeric[i]:
+                lengths[i] = max(lengths[i], len(value))
+    created = get_xpt_datetime()
+    records = [
+        XPT_HEADER.format("LIBRARY", "0" * 30),
+        "{:8}{:8}{:8}{:8}{:8}{:24}{:16}".format(
+            "SAS", "SAS", "SASLIB", "6.06", "bsd4.2", "", created
+        ),
+        "{:80}".format(created),
+        XPT_HEADER.format("MEMBER", "0" * 17 + "16" + "0" * 8 + "140"),
+        XPT_HEADER.format("DSCRPTR", "0" * 30),
+        "{:8}{:8}{:8}{:8}{:8}{:24}{:16}".format(
+            "SAS", get_xpt_names([name])[0], "SASDATA", "6.06", "bsd4.2", "", created
+        ),
+        "{:16}{:16}{:40}{:8}".format(created, "", label[:40], ""),
+        XPT_HEADER.format("NAMESTR", "000000{:04d}".format(len(columns)) + "0" * 20),
+    ]
+    namestrs = b"".join(
+        struct.pack(
+            ">hhhh8s40s8shhh2s8shhl52s",
+            1 if numeric[i] else 2,
+            0,
+            lengths[i],
+            i + 1,
+            xpt_name.ljust(8).encode("ascii"),
+            col.description[:40].ljust(40).encode("latin-1", "replace"),
+            b" " * 8,
+            0,
+            0,
+            0,
+            b"",
+            b" " * 8,
+            0,
+            0,
+            sum(lengths[:i]),
+            b"",
+        )
+        for i, (col, xpt_name) in enumerate(
+            zip(columns, get_xpt_names([col.name for col in columns]))
+        )
+    )
+    with open(path, "wb") as f:
+        f.write("".join(records).encode("latin-1", "replace"))
+        f.write(namestrs + b" " * (-len(namestrs) % 80))
+        f.write(XPT_HEADER.format("OBS", "0" * 30).encode("ascii"))
+        size = 0
+        for row in rows:
+            for i, value in enumerate(get_xpt_values(row, numeric)):
+                f.write(
+                    ibm_float(value) if numeric[i] else value.ljust(lengths[i], b" ")
+                )
+            size += sum(lengths)
+        f.write(b" " * (-size % 80))
+
+
+def write_csv(path: str, name: str, label: str, columns: ColumnSpec, rows):
+    # The column names, descriptions, types and cardinalities are written as
+    # the first four rows, as in the worksheets of the template.
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([col.name for col in columns])
+        writer.writerow([col.description for col in columns])
+        writer.writerow([col.type for col in columns])
+        writer.writerow([col.cardinality for col in columns])
+        writer.writerows(rows)
+
+
+def write_parquet(path: str, name: str, label: str, columns: ColumnSpec, rows):
+    # Requires pyarrow, which is only imported when Parquet files are written.
+    # Rows are written in record batches.
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Writing Parquet datasets requires pyarrow") from None
+
+    types = [
+        (
+            pyarrow.bool_()
+            if "Boolean" in col.type
+            else pyarrow.int64()
+            if "Integer" in col.type
+            else pyarrow.float64()
+            if is_numeric(col.type)
+            else pyarrow.string()
+        )
+        for col in columns
+    ]
+    schema = pyarrow.schema(
+        [
+            pyarrow.field(
+                col.name,
+                types[i],
+                metadata={
+                    "description": col.description,
+                    "cardinality": col.cardinality,
+                },
+            )
+            for i, col in enumerate(columns)
+        ],
+        metadata={"name": name, "label": label},
+    )
+    rows = iter(rows)
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for batch in iter(lambda: list(islice(rows, PARQUET_BATCH_ROWS)), []):
+            writer.write_batch(
+                pyarrow.RecordBatch.from_arrays(
+                    [
+                        pyarrow.array(
+                            [
+                                get_typed_value(
+                                    row[i] if i < len(row) else None, col.type
+                                )
+                                for row in batch
+                            ],
+                            types[i],
+                        )
+                        for i, col in enumerate(columns)
+                    ],
+                    schema=schema,
+                )
+            )
+
+
+def write_dataset(
+    format: str, output_dir: str, name: str, label: str, columns: ColumnSpec, rows=()
+) -> dict:
+    # Writes the dataset to <name>.<format> in the output directory and returns
+    # its entry in the manifest.
+    filename = f"{name}.{format}"
+    {"xpt": write_xpt, "csv": write_csv, "parquet": write_parquet}[format](
+        os.path.join(output_dir, filename), name, label, columns, rows
+    )
+    variables = [
+        {
+            "name": col.name,
+            "description": col.description,
+            "type": col.type,
+            "cardinality": col.cardinality,
+        }
+        for col in columns
+    ]
+    if format == "xpt":
+        for variable, xpt_name in zip(
+            variables, get_xpt_names([col.name for col in columns])
+        ):
+            variable["xpt_name"] = xpt_name
+    return {"filename": filename, "name": name, "label": label, "variables": variables}
@@ -0,0 +1,96 @@
+import json
+
+# Kinds of diagnostics that report how the sources were reconciled rather than
+# an inconsistency between them.
+INFO_KINDS = frozenset(
+    (
+        "general_property",
+        "abstract_class_excluded",
+        "api_attribute_substituted",
+        "api_only_attribute",
+        "max_depth_reached",
+        "worksheets_changed",
+        "worksheets_removed",
+    )
+)
+
+
+def render(message: str, files: dict) -> str:
+    # Messages refer to the input files by placeholders such as {ct_file}, so
+    # that they do not depend on where the files were read from.
+    for name, path in files.items():
+        message = message.replace("{" + name + "}", str(path))
+    return message
+
+
+class Diagnostic:
+    __slots__ = ("kind", "entity", "attribute", "message", "count")
+
+    def __init__(self, kind: str, entity: str, attribute: str, message: str):
+        self.kind = kind
+        self.entity = entity
+        self.attribute = attribute
+        self.message = message
+        self.count = 1
+
+    @property
+    def severity(self) -> str:
+        return "info" if self.kind in INFO_KINDS else "warning"
+
+
+class Diagnostics:
+    # Collects the (kind, entity, attribute, message) reports of a run, keeping
+    # the first message and the number of occurrences of each distinct
+    # (kind, entity, attribute) in the order first reported.
+    def __init__(self, reports: list = ()):
+        self.entries = {}
+        self.extend(reports)
+
+    def add(self, kind: str, entity: str, attribute: str, message: str):
+        key = (kind, entity, attribute)
+        if key in self.entries:
+            self.entries[key].count += 1
+        else:
+            self.entries[key] = Diagnostic(kind, entity, attribute, message)
+
+    def extend(self, reports: list):
+        for report in reports:
+            self.add(*report)
+
+    def get_findings(self) -> list:
+        return [x for x in self.entries.values() if x.severity != "info"]
+
+    def get_summary(self, files: dict) -> str:
+        return "".join(
+            render(x.message, files)
+            + (f" ({x.count} occurrences)" if x.count > 1 else "")
+            + "\n"
+            for x in self.entries.values()
+        )
+
+    def write_report(self, report_file: str, files: dict):
+        with open(report_file, "w") as f:
+            json.dump(
+                {
+                    "files": {name: str(path) for name, path in files.items()},
+                    "diagnostics": [
+                        {
+                            "kind": x.kind,
+                            "severity": x.severity,
+                            "entity": x.entity,
+                            "attribute": x.attribute,
+                            "message": render(x.message, files),
+                            "count": x.count,
+                        }
+                        for x in self.entries.values()
+                    ],
+                },
+                f,
+                indent=1,
+            )
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,36 @@
+import hashlib
+import json
+import os
+
+# Increment whenever the way entity worksheet columns are computed changes so
+# that columns stored by earlier versions are recomputed rather than reused.
+FINGERPRINT_VERSION = 6
+
+
+def get_fingerprint(*parts) -> str:
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def get_fingerprints_file(output_file: str) -> str:
+    return os.path.splitext(output_file)[0] + ".fingerprints.json"
+
+
+def read_fingerprints(fingerprints_file: str) -> dict:
+    try:
+        with open(fingerprints_file, "r") as f:
+            fingerprints = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (
+        not isinstance(fingerprints, dict)
+        or fingerprints.get("version") != FINGERPRINT_VERSION
+    ):
+        return {}
+    return fingerprints["entities"]
+
+
+def write_fingerprints(fingerprints_file: str, entities: dict):
+    with open(fingerprints_file, "w") as f:
+        json.dump({"version": FINGERPRINT_VERSION, "entities": entities}, f, indent=1)
@@ -0,0 +1,47 @@
+import hashlib
+import os
+import pickle
+from release import open_input
+
+# Increment whenever the structure of the cached model changes so that
+# caches written by earlier versions are rebuilt rather than reused.
+CACHE_FORMAT_VERSION = 4
+
+
+def get_file_hash(path) -> str:
+    # The file may be a member of a release archive.
+    h = hashlib.sha256()
+    with open_input(path) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_cache_file(cache_dir: str, *paths: str) -> str:
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(get_file_hash(path).encode())
+    return os.path.join(cache_dir, h.hexdigest() + ".pickle")
+
+
+def read_cache(cache_file: str) -> dict:
+    try:
+        with open(cache_file, "rb") as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_FORMAT_VERSION:
+        return None
+    return cache["model"]
+
+
+def write_cache(cache_file: str, model: dict):
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    with open(tmp_file, "wb") as f:
+        pickle.dump(
+            {"version": CACHE_FORMAT_VERSION, "model": model},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmp_file, cache_file)
@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from template_reader import SheetLayout
+
+# Properties of the USDM JSON document wrapper rather than of the study.
+WRAPPER_PROPERTIES = ("usdmVersion", "systemName", "systemVersion")
+
+
+def get_layout(entName: str, prps) -> SheetLayout:
+    # The layout of an entity worksheet from the columns it is created with.
+    return SheetLayout(
+        entName,
+        [
+            [x.name for x in prps],
+            [x.description for x in prps],
+            [x.type for x in prps],
+            [x.cardinality for x in prps],
+        ],
+    )
+
+
+def to_cell(value) -> str:
+    # Cells of the template are formatted as text.
+    if value is None:
+        return None
+    elif isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    elif isinstance(value, (dict, list)):
+        return json.dumps(value)
+    else:
+        return str(value)
+
+
+def get_value_sheet(value) -> str:
+    if value is None:
+        return "null"
+    elif isinstance(value, bool):
+        return "boolean"
+    elif isinstance(value, (int, float)):
+        return "float"
+    else:
+        return "string"
+
+
+def read_documents(json_files: list):
+    # Yields (file name, document) pairs, loading one document at a time.
+    for json_file in json_files:
+        with open(json_file, "r", encoding="utf-8") as f:
+            yield json_file, json.load(f)
+
+
+class SpooledRows:
+    # Rows of the datasets spooled by spool_rows, by dataset name. The rows of
+    # a dataset are read from the database each time they are iterated over.
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def get(self, dsname: str, default=()):
+        return DatasetRows(self.db, dsname)
+
+
+class DatasetRows:
+    __slots__ = ("db", "dsname")
+
+    def __init__(self, db: sqlite3.Connection, dsname: str):
+        self.db = db
+        self.dsname = dsname
+
+    def __iter__(self):
+        for (data,) in self.db.execute(
+            "SELECT data FROM rows WHERE dataset = ? ORDER BY seq", (self.dsname,)
+        ):
+            yield json.loads(data)
+
+
+@contextmanager
+def spool_rows(rows):
+    # Spools (dataset name, row) pairs to a temporary SQLite database, as the
+    # rows of a document belong to many datasets while dataset files are
+    # written one at a time. Yields the spooled rows by dataset name.
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db = sqlite3.connect(os.path.join(tmpdir, "rows.db"))
+        try:
+            db.execute(
+                "CREATE TABLE rows (seq INTEGER PRIMARY KEY, dataset TEXT, data TEXT)"
+            )
+            db.executemany(
+                "INSERT INTO rows (dataset, data) VALUES (?, ?)",
+                ((dsname, json.dumps(row)) for dsname, row in rows),
+            )
+            db.execute("CREATE INDEX rows_dataset ON rows (dataset)")
+            yield SpooledRows(db)
+        finally:
+            db.close()
+
+
+class DocumentFlattener:
+    # Flattens the object graph of USDM JSON documents into rows of the entity
+    # worksheets and value sheets, using the same column paths as the template:
+    # single relationships are expanded into dotted columns, while multiple
+    # relationships become rows of the target entity worksheet and multiple
+    # values become rows of a value sheet, linked to their parent by the
+    # parent_entity, parent_id and parent_rel columns.
+    def __init__(self, layouts: dict, report):
+        self.layouts = layouts
+        self.report = report
+        self.attributes = {}
+
+    def get_attributes(self, entName: str) -> dict:
+        # Names of the columns of the entity worksheet by the path of the
+        # (possibly nested) object they belong to.
+        if entName not in self.attributes:
+            attributes = {}
+            for _, path, _, _, _ in self.layouts[entName].columns:
+                attributes.setdefault(path[:-1], set()).add(path[-1])
+            self.attributes[entName] = attributes
+        return self.attributes[entName]
+
+    def check_attributes(self, json_file: str, entName: str, path: tuple, obj):
+        attributes = self.get_attributes(entName).get(path, ())
+        for name in obj:
+            if name not in attributes:
+                self.report(
+                    "prefill_attribute_not_in_template",
+                    entName,
+                    ".".join(path + (name,)),
+                    f"Attribute '{entName}.{'.'.join(path + (name,))}' in "
+                    + f"{json_file} has no column in the template",
+                )
+
+    def get_rows(self, json_file: str, document: dict):
+        # Yields (dataset name, row) pairs of the document, one object at a
+        # time.
+        queue = deque(
+            (k[0].upper() + k[1:], v, [None] * 4)
+            for k, v in document.items()
+            if k not in WRAPPER_PROPERTIES and isinstance(v, dict)
+        )
+        while queue:
+            entName, obj, parent = queue.popleft()
+            entName = obj.get("instanceType") or entName
+            if entName not in self.layouts:
+                self.report(
+                    "prefill_entity_not_in_template",
+                    entName,
+                    None,
+                    f"Entity '{entName}' in {json_file} has no worksheet in the "
+                    + "template",
+                )
+                continue
+            row, children, values = self.get_row(json_file, entName, obj, parent)
+            yield entName, row
+            queue.extend(children)
+            yield from values
+
+    def get_row(self, json_file: str, entName: str, obj: dict, parent: list):
+        layout = self.layouts[entName]
+        row = [None] * (max([x[0] for x in layout.columns], default=3) + 1)
+        row[:4] = parent
+        nodes = {(): (entName, obj)}
+        children = []
+        values = []
+        self.check_attributes(json_file, entName, (), obj)
+        for i, path, kind, _, clsName in layout.columns:
+            if path[:-1] not in nodes:
+                continue
+            owner, node = nodes[path[:-1]]
+            value = node.get(path[-1])
+            if kind == "object":
+                row[i] = to_cell(isinstance(value, dict))
+                if isinstance(value, dict):
+                    nodes[path] = (clsName, value)
+                    self.check_attributes(json_file, entName, path, value)
+            elif kind == "list":
+                items = (
+                    value
+                    if isinstance(value, list)
+                    else []
+                    if value is None
+                    else [value]
+                )
+                row[i] = to_cell(bool(items))
+                link = [owner, to_cell(node.get("id")), path[-1]]
+                for item in items:
+                    if isinstance(item, dict):
+                        children.append((clsName, item, link + ["definition"]))
+                    else:
+                        values.append(
+                            (get_value_sheet(item), link + ["value", to_cell(item)])
+                        )
+            else:
+                row[i] = to_cell(value)
+        return row, children, values
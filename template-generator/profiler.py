@@ -0,0 +1,196 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# Methods of TemplateGenerator whose calls are counted and whose recursion
+# depth is recorded for each entity worksheet.
+PROFILED_METHODS = (
+    "get_properties",
+    "get_linked_properties",
+    "get_description",
+    "get_apiattr",
+    "get_api_elements",
+)
+
+
+def get_peak_rss() -> int:
+    # The peak resident set size of the process so far in bytes, or None where
+    # the resource module is not available (Windows).
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Profiler:
+    # Records the wall time and the peak resident set size of the process at
+    # the end of each phase of a run and, if memory is traced, the peak memory
+    # allocated by Python during the phase, the time, call counts, recursion
+    # depth and number of columns of each entity worksheet, and the total
+    # number of calls of the profiled methods. Tracing memory slows down
+    # allocations considerably, and so the time of the phases.
+    def __init__(self, trace_memory: bool = False):
+        self.phases = []
+        self.entities = []
+        self.counters = {}
+        self.depths = {}
+        self.max_depths = {}
+        self.open_phases = []
+        self.tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+
+    def instrument(self, obj, names: tuple = PROFILED_METHODS):
+        # Replaces the methods of obj by wrappers counting their calls. Methods
+        # calling themselves through obj are counted on each recursion.
+        for name in names:
+            setattr(obj, name, self.counted(name, getattr(obj, name)))
+
+    def counted(self, name: str, func):
+        self.counters.setdefault(name, 0)
+        self.depths.setdefault(name, 0)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            self.counters[name] += 1
+            self.depths[name] += 1
+            if self.depths[name] > self.max_depths.get(name, 0):
+                self.max_depths[name] = self.depths[name]
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.depths[name] -= 1
+
+        return wrapper
+
+    def update_peaks(self):
+        # Phases may be nested, so the peak since the last update is added to
+        # all open phases before the peak is reset for the next phase.
+        if not self.tracing:
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for phase in self.open_phases:
+            phase["peak_memory"] = max(phase["peak_memory"], peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def phase(self, name: str):
+        self.update_peaks()
+        phase = {
+            "name": name,
+            "start": time.perf_counter() - self.start,
+            "duration": None,
+            "peak_memory": (
+                tracemalloc.get_traced_memory()[0] if self.tracing else None
+            ),
+            "peak_rss": None,
+        }
+        self.phases.append(phase)
+        self.open_phases.append(phase)
+        try:
+            yield phase
+        finally:
+            phase["duration"] = time.perf_counter() - self.start - phase["start"]
+            phase["peak_rss"] = get_peak_rss()
+            self.update_peaks()
+            self.open_phases.remove(phase)
+
+    def add_phase(self, name: str, start: float, duration: float):
+        # Records a phase timed elsewhere, e.g. in a worker process, whose memory
+        # is not measured.
+        self.phases.append(
+            {
+                "name": name,
+                "start": start,
+                "duration": duration,
+                "peak_memory": None,
+                "peak_rss": None,
+            }
+        )
+
+    @contextmanager
+    def entity(self, name: str):
+        # The caller is expected to set the number of columns of the record
+        # yielded.
+        counters = dict(self.counters)
+        self.max_depths = {}
+        entity = {
+            "name": name,
+            "start": time.perf_counter() - self.start,
+            "duration": None,
+            "columns": 0,
+        }
+        self.entities.append(entity)
+        try:
+            yield entity
+        finally:
+            entity["duration"] = time.perf_counter() - self.start - entity["start"]
+            entity["calls"] = {
+                k: v - counters.get(k, 0)
+                for k, v in self.counters.items()
+                if v != counters.get(k, 0)
+            }
+            entity["max_depth"] = self.max_depths
+
+    def close(self):
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def get_results(self) -> dict:
+        return {
+            "phases": self.phases,
+            "entities": self.entities,
+            "counters": self.counters,
+        }
+
+    def get_trace_events(self) -> list:
+        # Chrome trace format (as read by chrome://tracing or Perfetto) complete
+        # events, with times in microseconds.
+        pid = os.getpid()
+        events = [
+            {
+                "name": x["name"],
+                "cat": cat,
+                "ph": "X",
+                "ts": x["start"] * 1e6,
+                "dur": x["duration"] * 1e6,
+                "pid": pid,
+                "tid": pid,
+                "args": {
+                    k: v for k, v in x.items() if k not in ("name", "start", "duration")
+                },
+            }
+            for cat, records in (("phase", self.phases), ("entity", self.entities))
+            for x in records
+            if x["duration"] is not None
+        ]
+        events.append(
+            {
+                "name": "calls",
+                "cat": "counter",
+                "ph": "C",
+                "ts": (time.perf_counter() - self.start) * 1e6,
+                "pid": pid,
+                "tid": pid,
+                "args": self.counters,
+            }
+        )
+        return events
+
+    def write(self, profile_file: str, format: str = "json"):
+        with open(profile_file, "w") as f:
+            if format == "chrome":
+                json.dump(
+                    {"traceEvents": self.get_trace_events(), "displayTimeUnit": "ms"},
+                    f,
+                )
+            else:
+                json.dump(self.get_results(), f, indent=1)
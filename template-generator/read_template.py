@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+from template_reader import TemplateReader
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="""
+        USDM Test Data Template Reader. Reads a test data template created by
+        create_template.py and filled with test data (specified in the -t
+        option) and writes a USDM JSON file for each row without a parent
+        entity to the output directory (optionally specified in the -d
+        option)."""
+    )
+    parser.add_argument(
+        "-t",
+        "--template_file",
+        help="Filled test data template Excel file",
+        required=True,
+    )
+    parser.add_argument(
+        "-d",
+        "--output_dir",
+        help="[Optional] Directory to which the USDM JSON files are written, "
+        + "named <id of the top-level entity>.json. Default is the current "
+        + "directory.",
+        default=".",
+    )
+    parser.add_argument(
+        "-r",
+        "--report_file",
+        help="[Optional] JSON file to which the diagnostics are written.",
+        default=None,
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    reader = TemplateReader(args.template_file)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for n, document in enumerate(reader.read(), 1):
+        root = next(iter(document.values()))
+        output_file = os.path.join(
+            args.output_dir, "{}.json".format(root.get("id") or n)
+        )
+        with open(output_file, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Written {output_file}")
+    print(reader.diagnostics.get_summary(reader.files), end="")
+    if args.report_file:
+        reader.diagnostics.write_report(args.report_file, reader.files)
+
+
+if __name__ == "__main__":
+    main()
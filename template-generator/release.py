@@ -0,0 +1,97 @@
+import io
+import os
+import zipfile
+from contextlib import contextmanager
+from typing import NamedTuple
+
+# Conventional paths of the deliverables within the <DDF version> folder of a
+# DDF release, by input file. The API specification is read from its JSON form
+# if the release has one, as it is parsed faster than the YAML form.
+DELIVERABLES = {
+    "xmi_file": ("Deliverables/UML/USDM_UML.xmi",),
+    "ct_file": ("Deliverables/CT/USDM_CT.xlsx",),
+    "api_spec": (
+        "Deliverables/API/USDM_API.json",
+        "Deliverables/API/USDM_API.yaml",
+    ),
+}
+
+
+class ArchiveMember(NamedTuple):
+    # A file of a zip archive, which is read from the archive without being
+    # extracted.
+    archive: str
+    name: str
+
+    def __str__(self) -> str:
+        return f"{self.archive}!{self.name}"
+
+
+@contextmanager
+def open_input(source):
+    # Opens a file name or archive member for reading in binary mode. Members
+    # are decompressed as they are read, and can be seeked (e.g. by openpyxl).
+    # File objects are passed through, buffered if they cannot be peeked into
+    # (e.g. io.BytesIO). The buffer is then detached rather than closed, so
+    # that the file object is left open.
+    if isinstance(source, ArchiveMember):
+        with zipfile.ZipFile(source.archive) as archive:
+            with archive.open(source.name) as f:
+                yield f
+    elif hasattr(source, "peek"):
+        yield source
+    elif hasattr(source, "read"):
+        f = io.BufferedReader(source)
+        try:
+            yield f
+        finally:
+            f.detach()
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+
+def list_release(release: str) -> list:
+    # Paths of the files of a release directory or zip archive, relative to
+    # it and separated by "/".
+    if not os.path.isdir(release):
+        with zipfile.ZipFile(release) as archive:
+            return [x for x in archive.namelist() if not x.endswith("/")]
+    names = []
+    for dirpath, dirnames, filenames in os.walk(release):
+        dirnames[:] = sorted(x for x in dirnames if not x.startswith("."))
+        rel = os.path.relpath(dirpath, release).replace(os.sep, "/")
+        names.extend(x if rel == "." else f"{rel}/{x}" for x in sorted(filenames))
+    return names
+
+
+def find_deliverable(release: str, names: list, paths: tuple) -> str:
+    # The deliverable closest to the root of the release, in the first of the
+    # alternative paths found.
+    for path in paths:
+        found = [x for x in names if x == path or x.endswith("/" + path)]
+        if not found:
+            continue
+        depth = min(x.count("/") for x in found)
+        found = [x for x in found if x.count("/") == depth]
+        if len(found) > 1:
+            raise ValueError(
+                f"{release} contains several DDF versions (" + ", ".join(found) + ")"
+            )
+        return found[0]
+    raise ValueError(f"{release} does not contain {paths[-1]}")
+
+
+def find_deliverables(release: str) -> dict:
+    # Locates the XMI, CT and API files of a DDF release, given as a directory
+    # or as a zip archive (e.g. as downloaded from GitHub) whose members are
+    # then read without being extracted.
+    names = list_release(release)
+    files = {}
+    for opt, paths in DELIVERABLES.items():
+        name = find_deliverable(release, names, paths)
+        if os.path.isdir(release):
+            files[opt] = os.path.join(release, *name.split("/"))
+        else:
+            files[opt] = ArchiveMember(release, name)
+    return files
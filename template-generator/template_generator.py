@@ -0,0 +1,1665 @@
+import json
+import os
+import re
+import time
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from copy import deepcopy
+from functools import lru_cache
+from class_graph import ClassGraph
+from column_spec import ColumnSpec
+from dataset_writer import write_dataset
+from diagnostics import Diagnostics
+from fingerprints import (
+    get_fingerprint,
+    get_fingerprints_file,
+    read_fingerprints,
+    write_fingerprints,
+)
+from model_cache import get_cache_file, read_cache, write_cache
+from prefill import DocumentFlattener, get_layout, spool_rows
+from template_reader import CODELISTS_SHEET
+from profiler import Profiler
+from release import open_input
+from xmi_reader import read_xmi, UmlAttribute, UmlClass, XmiModel
+
+HEADER_FORMAT = {"bold": True, "align": "top", "text_wrap": True}
+
+SUB_HEADER_FORMAT = {
+    "italic": True,
+    "bg_color": "#FFFFCC",
+    "text_wrap": True,
+    "align": "top",
+}
+
+NORMAL_FORMAT = {"align": "top", "num_format": "@"}
+
+# Types of the values of multi-valued attributes and identifier lists, which
+# are entered in a value sheet of their own.
+VALUE_TYPES = ("String", "Float", "Boolean", "Null")
+
+# Sheet of the CT workbook listing the terms of each codelist.
+CT_CODELISTS_SHEET = "DDF valid value sets"
+
+# Last row of a worksheet, to which codelist validations extend.
+MAX_ROW = 1048575
+
+# Attributes of a Code whose columns are validated against its codelist, in the
+# order of the term columns of the codelists sheet.
+CODE_FIELDS = ("code", "decode")
+
+# Placeholder for the path prefix of a memoized linked class expansion, which
+# is substituted with the actual prefix each time the expansion is reused.
+SUBTREE_PREFIX = "\0"
+
+# Placeholder for the entity a memoized linked class expansion is reached from,
+# which is substituted in its reports each time the expansion is reused.
+SUBTREE_ENTITY = "\1"
+
+
+def get_schema_difference(vi, vo) -> tuple:
+    # Compares an API Input schema with the corresponding Output schema, in
+    # which "Output" is read as "Input", and returns the path to the first
+    # difference (or None if they match). The path is only built once a
+    # difference is found.
+    if isinstance(vo, dict):
+        return get_dict_difference(vi, vo) if isinstance(vi, dict) else ()
+    elif isinstance(vo, list):
+        return get_list_difference(vi, vo) if isinstance(vi, list) else ()
+    elif isinstance(vo, str) and "Output" in vo:
+        return None if vi == vo.replace("Output", "Input") else ()
+    else:
+        return None if vi == vo else ()
+
+
+def get_dict_difference(vi: dict, vo: dict) -> tuple:
+    for k, v in vi.items():
+        if k not in vo:
+            return (k,)
+        diff = get_schema_difference(v, vo[k])
+        if diff is not None:
+            return (k,) + diff
+    for k in vo:
+        if k not in vi:
+            return (k,)
+    return None
+
+
+def get_list_difference(vi: list, vo: list) -> tuple:
+    for i, (v, w) in enumerate(zip(vi, vo)):
+        diff = get_schema_difference(v, w)
+        if diff is not None:
+            return (i,) + diff
+    if len(vi) != len(vo):
+        return (min(len(vi), len(vo)),)
+    return None
+
+
+def get_api_desc(prp: str, prpDict: dict) -> str:
+    if "type" in prpDict and prpDict["type"] == "array":
+        return name_to_desc(prp) + " [Any Exist]"
+    elif "$ref" in prpDict or (
+        "anyOf" in prpDict and any("$ref" in x for x in prpDict["anyOf"])
+    ):
+        return name_to_desc(prp) + " [Exists]"
+    else:
+        return name_to_desc(prp)
+
+
+def get_api_type(prpDict: dict) -> str:
+    if (
+        ("type" in prpDict and prpDict["type"] == "array")
+        or "$ref" in prpDict
+        or ("anyOf" in prpDict and any("$ref" in x for x in prpDict["anyOf"]))
+    ):
+        return "Boolean"
+    elif "const" in prpDict:
+        return "String"
+    elif "type" in prpDict:
+        return prpDict["type"].title()
+    elif "anyOf" in prpDict:
+        return "".join(
+            x["type"].title()
+            for x in prpDict["anyOf"]
+            if "type" in x and x["type"] != "'null'"
+        )
+    else:
+        return "!!UNKNOWN API TYPE!!"
+
+
+def name_to_desc(name: str) -> str:
+    return re.sub("([A-Z]+)", r" \1", name).strip().title()
+
+
+def get_card(attr: UmlAttribute) -> str:
+    if attr.lower == attr.upper:
+        return "[{}]".format(attr.lower)
+    else:
+        return "[{}..{}]".format(attr.lower, attr.upper)
+
+
+def get_value_columns(pdtype: str) -> ColumnSpec:
+    return ColumnSpec(
+        [
+            ["parent_entity", "Parent Entity Name", "String", "[1]"],
+            ["parent_id", "Parent Entity Id", "String", "[1]"],
+            [
+                "parent_rel",
+                "Name of Relationship from Parent Entity",
+                "String",
+                "[1]",
+            ],
+            ["rel_type", "Type of Relationship", "String", "[1]"],
+            ["value", "Value", "String", "[0]" if pdtype == "Null" else "[1]"],
+        ]
+    )
+
+
+def get_codelist_name(cref: str, field: str) -> str:
+    # Workbook-level defined name of the codes or decodes of a codelist.
+    return "Codelist_{}_{}".format(re.sub(r"\W", "_", cref), field)
+
+
+def get_sheet_name(entName: str) -> str:
+    return entName + ".xpt" if len(entName) <= 27 else entName[:27] + ".xpt"
+
+
+@lru_cache(maxsize=None)
+def get_inflect():
+    from inflect import engine
+
+    inflect = engine()
+    inflect.defnoun("previous", "previous")
+    inflect.defnoun("context", "context")
+    inflect.defnoun("to", "to")
+    inflect.defnoun("of", "of")
+    return inflect
+
+
+@lru_cache(maxsize=None)
+def get_singular_noun(word: str):
+    # Memoized across entities, as the same relationship names recur.
+    return get_inflect().singular_noun(word)
+
+
+def read_api_schemas(api_spec) -> dict:
+    # The JSON form of the specification is read directly, and the YAML form
+    # with the libyaml based loader if PyYAML was built with it, both from the
+    # binary stream (e.g. of a release archive member) rather than from a copy
+    # of its text. Only the schemas are kept.
+    with open_input(api_spec) as f:
+        if f.peek(64)[:64].lstrip().startswith(b"{"):
+            apispec = json.load(f)
+        else:
+            import yaml
+
+            apispec = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    return apispec["components"]["schemas"]
+
+
+class ApiSchemas(Mapping):
+    # API attributes by class name. The attributes of a class are built from
+    # its schema, adding the required flag of each, when first accessed.
+    def __init__(self, schemas: dict, index: dict):
+        self.schemas = schemas
+        self.index = index
+        self.classes = {}
+
+    def __getitem__(self, cname: str) -> dict:
+        if cname not in self.classes:
+            schema = self.schemas[self.index[cname]]
+            # The schema properties are only copied one level deep, to add the
+            # required flag without changing the schemas.
+            required = frozenset(schema.get("required", ()))
+            self.classes[cname] = {
+                apiattn: dict(apiattv, required=apiattn in required)
+                for apiattn, apiattv in schema.get("properties", {}).items()
+            }
+        return self.classes[cname]
+
+    def __contains__(self, cname) -> bool:
+        return cname in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def load_api(api_spec: str, reports: list = None) -> ApiSchemas:
+    if reports is None:
+        reports = []
+
+    schemas = read_api_schemas(api_spec)
+
+    # Schema names by class name, where a class is described by the last of
+    # its schemas.
+    index = {}
+
+    for k, v in schemas.items():
+        if "-" in k:
+            if k.endswith("-Input"):
+                cname = "".join(k.split("-")[:1])
+                if cname + "-Output" in schemas:
+                    vo = schemas[cname + "-Output"]
+                    diff = get_schema_difference(v, vo)
+                    if diff is not None:
+                        reports.append(
+                            (
+                                "api_io_mismatch",
+                                cname,
+                                None,
+                                f"API Input/Output definitions do not match for {cname}"
+                                + " (first difference at '"
+                                + "/".join(str(x) for x in diff)
+                                + f"')\n{cname}-Input : {v}\n{cname}-Output: {vo}",
+                            )
+                        )
+                else:
+                    reports.append(
+                        (
+                            "api_output_missing",
+                            cname,
+                            None,
+                            f"No corresponding API Output definition for {k}",
+                        )
+                    )
+        else:
+            cname = k
+
+        index[cname] = k
+
+    return ApiSchemas(schemas, index)
+
+
+def read_codelist_terms(clws, refs: dict, codelists: dict):
+    # Adds the (code, decode) pairs of the terms of the referenced codelists in
+    # the codelists sheet of the CT workbook to codelists.
+    clrows = clws.iter_rows(values_only=True)
+    clcolmap = {clcol: i for i, clcol in enumerate(next(clrows))}
+    clcol, codecol, decodecol = (
+        next((clcolmap[x] for x in names if x in clcolmap), None)
+        for names in (
+            ("Codelist C-Code", "Codelist Code"),
+            ("Code",),
+            ("Preferred Term", "NCI Preferred Term", "CDISC Submission Value"),
+        )
+    )
+    if clcol is None or codecol is None or decodecol is None:
+        return
+    for clrow in clrows:
+        clrow += (None,) * (len(clcolmap) - len(clrow))
+        if clrow[clcol] in refs and clrow[codecol]:
+            codelists.setdefault(clrow[clcol], []).append(
+                (clrow[codecol], clrow[decodecol])
+            )
+
+
+def load_codelists(ctwb, entdict: dict, codelists: dict, reports: list):
+    # Adds the terms of each codelist referenced by an attribute or relationship
+    # to codelists, by codelist C-code.
+    refs = {}
+    for entName, entDef in entdict.items():
+        for elname, prpDef in entDef["Properties"].items():
+            if prpDef["CodelistRef"]:
+                refs.setdefault(prpDef["CodelistRef"], (entName, elname))
+    if not refs:
+        return
+    if CT_CODELISTS_SHEET not in ctwb.sheetnames:
+        reports.append(
+            (
+                "ct_codelists_missing",
+                None,
+                None,
+                f"No '{CT_CODELISTS_SHEET}' sheet found in {{ct_file}}, so no "
+                + "codelists are added to the template",
+            )
+        )
+        return
+    read_codelist_terms(ctwb[CT_CODELISTS_SHEET], refs, codelists)
+    for cref, (entName, elname) in refs.items():
+        if cref not in codelists:
+            reports.append(
+                (
+                    "codelist_not_in_ct",
+                    entName,
+                    elname,
+                    f"Codelist {cref} of '{entName}.{elname}' not found in the "
+                    + f"'{CT_CODELISTS_SHEET}' sheet of {{ct_file}}",
+                )
+            )
+
+
+def load_ct(ct_file: str, reports: list = None, codelists: dict = None) -> dict:
+    # The referenced codelists are also loaded if a codelists dictionary is
+    # given.
+    import openpyxl
+
+    if reports is None:
+        reports = []
+
+    entdict = {}
+
+    # Read-only mode parses only the sheet that is iterated over, row by row,
+    # instead of loading every codelist sheet of the workbook into memory. A
+    # CT file in a release archive is read from the archive member, which
+    # openpyxl seeks in.
+    with open_input(ct_file) as f:
+        ctwb = openpyxl.load_workbook(filename=f, read_only=True, data_only=True)
+
+        try:
+            ctrows = ctwb["DDF Entities&Attributes"].iter_rows(values_only=True)
+
+            ctcolmap = {ctcol: i for i, ctcol in enumerate(next(ctrows))}
+
+            for ctrow in ctrows:
+                # Rows are not padded to the sheet width if the workbook does not
+                # record its dimensions.
+                ctrow += (None,) * (len(ctcolmap) - len(ctrow))
+                entName = ctrow[ctcolmap["Entity Name"]]
+                elrole = ctrow[ctcolmap["Role"]]
+                elname = ctrow[ctcolmap["Logical Data Model Name"]]
+                if elrole == "Entity":
+                    if elname != entName:
+                        reports.append(
+                            (
+                                "ct_entity_name_mismatch",
+                                entName,
+                                None,
+                                f"Entity Name '{entName}' does not match Logical Data "
+                                + f"Model Name for Entity '{elname}'",
+                            )
+                        )
+                    entdict[entName] = {
+                        "NCI C-code": ctrow[ctcolmap["NCI C-code"]],
+                        "Preferred Name": ctrow[ctcolmap["CT Item Preferred Name"]],
+                        "Definition": ctrow[ctcolmap["Definition"]],
+                        "Properties": {},
+                    }
+                else:
+                    cref: str = None
+                    cref = re.search(
+                        r"^Y \((.+?)\)$", str(ctrow[ctcolmap["Has Value List"]]).strip()
+                    )
+
+                    entdict[entName]["Properties"][elname] = {
+                        "name": elname,
+                        "Role": elrole,
+                        "NCI C-code": ctrow[ctcolmap["NCI C-code"]],
+                        "Preferred Name": ctrow[ctcolmap["CT Item Preferred Name"]],
+                        "Definition": ctrow[ctcolmap["CT Item Preferred Name"]],
+                        "CodelistRef": cref.group(1) if cref else None,
+                    }
+
+            if codelists is not None:
+                load_codelists(ctwb, entdict, codelists, reports)
+        finally:
+            ctwb.close()
+
+    return entdict
+
+
+def get_cpu_count() -> int:
+    # The CPUs this process may run on, which may be fewer than the machine has.
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def run_loader(loader, source: str, *outputs) -> tuple:
+    # Runs a loader in a worker process, returning the reports list and other
+    # output arguments it filled (as those given to it are copies) and its
+    # duration together with its result.
+    start = time.perf_counter()
+    result = loader(source, *outputs)
+    return result, outputs, time.perf_counter() - start
+
+
+def load_inputs(xmi_file: str, ct_file: str, api_spec: str, reports: list) -> tuple:
+    # The XMI, API and CT files do not depend on each other until they are
+    # reconciled, so they are loaded at the same time in worker processes and
+    # the wall time is that of the slowest. Returns the XMI model, API and CT
+    # dictionaries, the codelists and the duration of each loader by phase
+    # name.
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        futures = {
+            "read_xmi": pool.submit(run_loader, read_xmi, xmi_file),
+            "load_api": pool.submit(run_loader, load_api, api_spec, []),
+            "load_ct": pool.submit(run_loader, load_ct, ct_file, [], {}),
+        }
+        results = {}
+        outputs = {}
+        durations = {}
+        for name, future in futures.items():
+            results[name], outputs[name], durations[name] = future.result()
+            reports.extend(outputs[name][0] if outputs[name] else ())
+    return (
+        results["read_xmi"],
+        results["load_api"],
+        results["load_ct"],
+        outputs["load_ct"][1],
+        durations,
+    )
+
+
+class TemplateGenerator:
+    # Generates the test data template of one USDM version. The model is
+    # loaded from the XMI, CT and API files unless already loaded objects
+    # (as returned by read_xmi, load_api and load_ct, with the codelists
+    # filled in by load_ct) are given, together with the reports those loaders
+    # made, in which case the file names are only used in messages. The files
+    # are loaded concurrently unless sequential_load is set or only one CPU is
+    # available. Each file may also be a member of a release archive (an
+    # ArchiveMember, as located by release.find_deliverables).
+    def __init__(
+        self,
+        xmi_file: str,
+        ct_file: str,
+        api_spec: str,
+        usdmxmi: XmiModel = None,
+        apidict: dict = None,
+        entdict: dict = None,
+        cache_dir: str = None,
+        profiler: Profiler = None,
+        max_depth: int = None,
+        sequential_load: bool = False,
+        codelists: dict = None,
+        reports: list = None,
+    ):
+        self.xmi_file = xmi_file
+        self.ct_file = ct_file
+        self.api_spec = api_spec
+        self.max_depth = max_depth
+        self.subtrees = {}
+        self.api_elements = {}
+        self.reports = []
+        self.profiler = profiler
+        if profiler:
+            profiler.instrument(self)
+        # The cache is keyed by the contents of the files, so it is only used
+        # when the whole model is loaded from them.
+        cache_file = (
+            get_cache_file(cache_dir, xmi_file, ct_file, api_spec)
+            if cache_dir and usdmxmi is None and apidict is None and entdict is None
+            else None
+        )
+        model = None
+        if cache_file:
+            with self.phase("read_cache"):
+                model = read_cache(cache_file)
+        if not model:
+            model = self.load_model(
+                usdmxmi,
+                apidict,
+                entdict,
+                codelists,
+                reports,
+                sequential_load
+                or get_cpu_count() < 2
+                or usdmxmi is not None
+                or apidict is not None
+                or entdict is not None,
+            )
+            if cache_file:
+                with self.phase("write_cache"):
+                    write_cache(cache_file, model)
+        self.set_model(model)
+
+    @property
+    def files(self) -> dict:
+        return {
+            "xmi_file": self.xmi_file,
+            "ct_file": self.ct_file,
+            "api_spec": self.api_spec,
+        }
+
+    def phase(self, name: str):
+        return self.profiler.phase(name) if self.profiler else nullcontext()
+
+    def report(self, kind: str, entity: str, attribute: str, message: str):
+        # Messages refer to the input files by placeholders (see
+        # diagnostics.render) and are only rendered when the diagnostics are
+        # written.
+        self.reports.append((kind, entity, attribute, message))
+
+    @contextmanager
+    def collect_reports(self):
+        # Collects the reports made within the block separately, e.g. to
+        # replay them for a memoized expansion or to return them from a worker
+        # process.
+        reports, self.reports = self.reports, []
+        try:
+            yield self.reports
+        finally:
+            self.reports = reports
+
+    def get_expanded_classes(self, cls: UmlClass) -> list:
+        # Classes whose definitions are used when expanding cls, i.e. cls, its
+        # generalizations and, transitively, its single cardinality linked classes.
+        expanded = []
+        visited = set()
+        stack = [cls]
+        while stack:
+            vcls = stack.pop()
+            if vcls.id in visited:
+                continue
+            visited.add(vcls.id)
+            expanded.append(vcls)
+            if self.usdmxmi.get_general(vcls):
+                stack.append(self.usdmxmi.get_general(vcls))
+            for lnk in self.usdmxmi.get_links(vcls):
+                if lnk.multiplicity.endswith("1") and self.usdmxmi.get_target(lnk):
+                    stack.append(self.usdmxmi.get_target(lnk))
+        return expanded
+
+    def get_linked_properties(
+        self, entName: str, lcls: UmlClass, prps: ColumnSpec, prefix: list
+    ):
+        # The expansion of a linked class does not depend on the entity or path it
+        # is reached from, except for classes already on the path (which are
+        # reported as circular) and the remaining depth, so it is computed once
+        # per class and path context and then re-prefixed, with its reports
+        # attributed to the entity reusing it. Only classes of the same strongly
+        # connected component can be reached again from lcls.
+        key = (
+            lcls.id,
+            prefix[3] & self.class_graph.get_component(lcls),
+            None if self.max_depth is None else self.max_depth - prefix[4],
+        )
+        if key not in self.subtrees:
+            lprps = ColumnSpec()
+            with self.collect_reports() as lreports:
+                self.get_properties(
+                    SUBTREE_ENTITY,
+                    lcls,
+                    lprps,
+                    [SUBTREE_PREFIX, SUBTREE_PREFIX, SUBTREE_PREFIX] + prefix[3:],
+                    lcls.name,
+                )
+            self.subtrees[key] = (lprps, lreports)
+        lprps, lreports = self.subtrees[key]
+        for col in lprps:
+            prps.add(
+                col.name.replace(SUBTREE_PREFIX, prefix[0]),
+                col.description.replace(SUBTREE_PREFIX, prefix[1]),
+                col.type,
+                col.cardinality.replace(SUBTREE_PREFIX, prefix[2]),
+            )
+        for kind, entity, attribute, message in lreports:
+            self.report(
+                kind,
+                entName if entity == SUBTREE_ENTITY else entity,
+                attribute and attribute.replace(SUBTREE_PREFIX, prefix[0]),
+                message.replace(SUBTREE_PREFIX, prefix[0]).replace(
+                    SUBTREE_ENTITY, entName
+                ),
+            )
+
+    def get_properties(
+        self,
+        entName: str,
+        cls: UmlClass,
+        prps: ColumnSpec,
+        prefix: list = None,
+        lclsName: str = None,
+    ):
+        # Traverses the expansion plan of cls, from its most general class down
+        # to cls itself.
+        for vcls, descName, attributes, links in self.class_graph.get_plan(cls):
+            self.add_attributes(entName, attributes, prps, prefix, descName or lclsName)
+            if not prefix and vcls is cls and cls.name == entName:
+                for prp in self.get_api_only_attributes(entName):
+                    prps.add(
+                        prp,
+                        get_api_desc(prp, self.apidict[entName][prp]),
+                        get_api_type(self.apidict[entName][prp]),
+                        (
+                            "[1]"
+                            if self.apidict[entName][prp]["required"] is True
+                            else "[0]"
+                        ),
+                    )
+                    self.report_api_only_attribute(entName, prp)
+            for lnk, lcls in links:
+                self.add_link(
+                    entName, cls, lnk, lcls, prps, prefix, descName or lclsName
+                )
+
+    def add_attributes(
+        self,
+        entName: str,
+        attributes: tuple,
+        prps: ColumnSpec,
+        prefix: list,
+        lclsName: str,
+    ):
+        for prp, attr in attributes:
+            prps.add(
+                ".".join((prefix[0], prp.name)) if prefix else prp.name,
+                (
+                    " / ".join(
+                        (prefix[1], self.get_description(lclsName or entName, prp.name))
+                    )
+                    if prefix
+                    else self.get_description(lclsName or entName, prp.name)
+                )
+                + ""
+                if attr.upper == "1"
+                else " [Any Exist]",
+                attr.type if attr.upper == "1" else "Boolean",
+                (
+                    "{}.{}{}".format(prefix[2], prp.name, get_card(attr))
+                    if prefix
+                    else get_card(attr)
+                ),
+            )
+
+    def add_link(
+        self,
+        entName: str,
+        cls: UmlClass,
+        lnk,
+        lcls: UmlClass,
+        prps: ColumnSpec,
+        prefix: list,
+        lclsName: str,
+    ):
+        if lnk.name not in self.entdict[lclsName if prefix else entName]["Properties"]:
+            if not prefix:
+                self.report_relationship(entName, lnk.name)
+            return
+        if prefix:
+            lnkName = ".".join((prefix[0], lnk.name))
+            lnkDesc = " / ".join(
+                (
+                    prefix[1],
+                    self.get_description(lclsName or entName, lnk.name),
+                )
+            )
+            lnkCard = ">".join(
+                (
+                    prefix[2],
+                    "{}[{}]".format(
+                        lcls.name,
+                        lnk.multiplicity,
+                    ),
+                )
+            )
+        else:
+            lnkName = lnk.name
+            lnkDesc = self.get_description(lclsName or entName, lnk.name)
+            lnkCard = "{}[{}]".format(lcls.name, lnk.multiplicity)
+        apiattr = self.entdict[lclsName if prefix else entName]["Properties"][
+            lnk.name
+        ].get("apiattr")
+        if apiattr is not None and apiattr != lnk.name:
+            self.add_reference(entName, lnk, apiattr, prps, prefix, lclsName)
+            return
+        single_lnk = lnk.multiplicity.endswith("1")
+        prps.add(
+            lnkName,
+            lnkDesc + (" [Exists]" if single_lnk else " [Any Exists]"),
+            "Boolean",
+            lnkCard,
+        )
+        if not single_lnk:
+            return
+        # The classes on the path, including the class of the entity itself. A
+        # relationship back to one of them keeps its [Exists] column but is not
+        # expanded.
+        classes = prefix[3] if prefix else frozenset((cls.id,))
+        if lcls.id in classes:
+            self.report(
+                "circular_relationship",
+                entName,
+                lnkName,
+                f"Circular relationship found: {lnkName} refers back to "
+                + f"{lcls.name}",
+            )
+            return
+        depth = prefix[4] if prefix else 0
+        if self.max_depth is not None and depth >= self.max_depth:
+            self.report(
+                "max_depth_reached",
+                entName,
+                lnkName,
+                f"Relationship '{entName}.{lnkName}' not expanded beyond the "
+                + f"maximum depth of {self.max_depth}",
+            )
+        else:
+            self.get_linked_properties(
+                entName,
+                lcls,
+                prps,
+                [lnkName, lnkDesc, lnkCard, classes | {lcls.id}, depth + 1],
+            )
+
+    def add_reference(
+        self,
+        entName: str,
+        lnk,
+        apiattr: str,
+        prps: ColumnSpec,
+        prefix: list,
+        lclsName: str,
+    ):
+        # Relationships referring to objects by identifier rather than
+        # containing them.
+        single_lnk = lnk.multiplicity.endswith("1")
+        if (".".join((prefix[0], apiattr)) if prefix else apiattr) in prps:
+            prps.get(
+                ".".join((prefix[0], apiattr)) if prefix else apiattr
+            ).cardinality += " / {}".format(
+                ">".join(
+                    (
+                        prefix[2],
+                        "{}[{}].id[1]".format(
+                            lnk.target_name,
+                            lnk.multiplicity,
+                        ),
+                    )
+                )
+                if prefix
+                else "{}[{}].id[1]".format(lnk.target_name, lnk.multiplicity)
+            )
+        else:
+            prps.add(
+                ".".join((prefix[0], apiattr)) if prefix else apiattr,
+                "{} [{}]".format(
+                    " / ".join(
+                        (
+                            prefix[1],
+                            self.get_description(lclsName or entName, lnk.name),
+                        )
+                    )
+                    if prefix
+                    else self.get_description(lclsName or entName, lnk.name),
+                    "Identifier" if single_lnk else "Identifiers][Any Exist",
+                ),
+                "String" if single_lnk else "Boolean",
+                ">".join(
+                    (
+                        prefix[2],
+                        "{}[{}].id[1]".format(
+                            lnk.target_name,
+                            lnk.multiplicity,
+                        ),
+                    )
+                )
+                if prefix
+                else "{}[{}].id[1]".format(lnk.target_name, lnk.multiplicity),
+            )
+
+    def report_api_only_attribute(self, entName: str, prpName: str):
+        self.report(
+            "api_only_attribute",
+            entName,
+            prpName,
+            f"API-only attribute '{entName}.{prpName}' added from {{api_spec}}",
+        )
+
+    def report_relationship(self, entName: str, lnkName: str):
+        self.report(
+            "relationship_not_in_ct",
+            entName,
+            lnkName,
+            f"Relationship '{entName}.{lnkName}' defined in {{xmi_file}} does not "
+            + "have a matching entry in {ct_file}",
+        )
+
+    def get_api_elements(self, entName: str) -> dict:
+        # CT elements of the entity by the API attribute they resolve to.
+        if entName not in self.api_elements:
+            self.api_elements[entName] = {
+                v["apiattr"]: k
+                for k, v in self.entdict[entName]["Properties"].items()
+                if v["apiattr"] is not None
+            }
+        return self.api_elements[entName]
+
+    def get_api_only_attributes(self, entName: str) -> list:
+        api_elements = self.get_api_elements(entName)
+        return [
+            x
+            for x in self.apidict[entName].keys()
+            if x != "id"
+            and x not in self.entdict[entName]["Properties"]
+            and x not in api_elements
+        ]
+
+    def get_description(self, entName: str, prpName: str = None) -> str:
+        if (
+            prpName in self.entdict[entName]["Properties"]
+            and self.entdict[entName]["Properties"][prpName]["Preferred Name"]
+        ):
+            return self.entdict[entName]["Properties"][prpName]["Preferred Name"]
+        else:
+            if not (prpName in self.entdict[entName]["Properties"] or prpName == "id"):
+                self.report(
+                    "attribute_not_in_ct",
+                    entName,
+                    prpName,
+                    "No entry found in {ct_file} for USDM "
+                    + f"attribute '{entName}.{prpName}'",
+                )
+            return "({} {})".format(name_to_desc(entName), name_to_desc(prpName))
+
+    def get_apiattr(self, entName: str, elname: str, elrole: str) -> str:
+        if elname in self.apidict[entName]:
+            return elname
+        else:
+            if elrole == "Attribute":
+                self.report(
+                    "api_attribute_missing",
+                    entName,
+                    elname,
+                    f"No entry found in {{api_spec}} for '{entName}.{elname}'",
+                )
+                return None
+            else:
+                elprts = re.findall(r"([A-Z]?[a-z]+)", elname.strip())
+                singular = get_singular_noun(elprts[-1])
+                if singular is False or singular == elprts[-1]:
+                    if elname + "Id" in self.apidict[entName]:
+                        return elname + "Id"
+                    elif (
+                        singular == elprts[-1]
+                        and elname + "Ids" in self.apidict[entName]
+                    ):
+                        return elname + "Ids"
+                    else:
+                        self.report(
+                            "api_attribute_missing",
+                            entName,
+                            elname,
+                            f"No entry found in {{api_spec}} for '{entName}."
+                            + f"{elname}' or '{entName}.{elname}Id'",
+                        )
+                else:
+                    sname = (
+                        get_singular_noun(elname)
+                        if len(elprts) == 1
+                        else "".join(elprts[:-1]) + singular
+                    ) + "Ids"
+                    if sname in self.apidict[entName]:
+                        return sname
+                    elif elname + "Ids" in self.apidict[entName]:
+                        self.report(
+                            "api_attribute_substituted",
+                            entName,
+                            elname,
+                            f"Using '{entName}.{elname}Ids' instead of "
+                            + f"'{entName}.{sname}' for API attribute",
+                        )
+                        return elname + "Ids"
+                    else:
+                        self.report(
+                            "api_attribute_missing",
+                            entName,
+                            elname,
+                            f"No entry found in {{api_spec}} for '{entName}."
+                            + f"{elname}', '{entName}.{sname}' or "
+                            + f"'{entName}.{elname}Ids'",
+                        )
+                        return None
+
+    def resolve_entities(self):
+        for entName, entDef in self.entdict.items():
+            cls = self.usdmxmi.get_class(entName)
+            if self.usdmxmi.get_general(cls):
+                gclsName = self.usdmxmi.get_general(cls).name
+                if gclsName in self.entdict:
+                    for gprp in self.entdict[gclsName]["Properties"].keys():
+                        if gprp not in entDef["Properties"]:
+                            entDef["Properties"][gprp] = deepcopy(
+                                self.entdict[gclsName]["Properties"][gprp]
+                            )
+                            self.report(
+                                "general_property",
+                                entName,
+                                gprp,
+                                f"Using general '{gclsName}.{gprp}' "
+                                + entDef["Properties"][gprp]["Role"].lower()
+                                + f" in '{entName}' specialization",
+                            )
+            if entName in self.apidict:
+                for prpName, prpDef in entDef["Properties"].items():
+                    prpDef["apiattr"] = self.get_apiattr(
+                        entName, prpName, prpDef["Role"]
+                    )
+
+    def exclude_abstract_classes(self):
+        for abscls in (
+            x.name
+            for x in self.usdmxmi.class_elements
+            if x.isAbstract == "true" or x.name not in self.apidict
+        ):
+            if abscls in self.entdict:
+                self.entdict.pop(abscls)
+                self.report(
+                    "abstract_class_excluded",
+                    abscls,
+                    None,
+                    f"Excluding abstract class '{abscls}'",
+                )
+            else:
+                self.report(
+                    "abstract_class_not_in_ct",
+                    abscls,
+                    None,
+                    f"Abstract class {abscls} not found in {{ct_file}}",
+                )
+
+    def check_api_classes(self):
+        for clsName in self.apidict:
+            if clsName not in self.entdict:
+                self.report(
+                    "api_class_not_in_ct",
+                    clsName,
+                    None,
+                    f"No entry found in {{ct_file}} for API class '{clsName}' from "
+                    + "{api_spec}",
+                )
+            else:
+                for prp in self.get_api_only_attributes(clsName):
+                    self.report(
+                        "api_attribute_not_in_ct",
+                        clsName,
+                        prp,
+                        "No corresponding entry found in {ct_file} for API "
+                        + f"attribute '{clsName}.{prp}' from {{api_spec}}",
+                    )
+
+    def check_xmi_links(self):
+        for lnk in self.usdmxmi.incomplete_links:
+            cls = self.usdmxmi.classes_by_id.get(lnk.source)
+            clsName = cls.name if cls else None
+            self.report(
+                "xmi_connector_incomplete",
+                clsName,
+                lnk.name,
+                f"Relationship '{clsName}.{lnk.name}' defined in {{xmi_file}} has "
+                + "no source, target or multiplicity and is ignored",
+            )
+
+    def load_model(
+        self,
+        usdmxmi: XmiModel = None,
+        apidict: dict = None,
+        entdict: dict = None,
+        codelists: dict = None,
+        loader_reports: list = None,
+        sequential: bool = True,
+    ) -> dict:
+        with self.collect_reports() as reports:
+            reports.extend(loader_reports or ())
+            if sequential:
+                self.load_sequentially(usdmxmi, apidict, entdict, codelists, reports)
+            else:
+                with self.phase("load") as phase:
+                    (
+                        self.usdmxmi,
+                        self.apidict,
+                        self.entdict,
+                        self.codelists,
+                        durations,
+                    ) = load_inputs(self.xmi_file, self.ct_file, self.api_spec, reports)
+                if self.profiler:
+                    # The loaders start together at the start of the load phase.
+                    for name, duration in durations.items():
+                        self.profiler.add_phase(name, phase["start"], duration)
+            if self.profiler:
+                # The one-off import of inflect is not part of resolving.
+                with self.phase("import_inflect"):
+                    get_inflect()
+            with self.phase("resolve"):
+                self.resolve_entities()
+                self.exclude_abstract_classes()
+                self.check_api_classes()
+                self.check_xmi_links()
+        return {
+            "reports": reports,
+            "usdmxmi": self.usdmxmi,
+            "apidict": self.apidict,
+            "entdict": self.entdict,
+            "codelists": self.codelists,
+            "usdmver": self.usdmxmi.version,
+        }
+
+    def load_sequentially(
+        self,
+        usdmxmi: XmiModel,
+        apidict: dict,
+        entdict: dict,
+        codelists: dict,
+        reports: list,
+    ):
+        with self.phase("read_xmi"):
+            self.usdmxmi = read_xmi(self.xmi_file) if usdmxmi is None else usdmxmi
+        with self.phase("load_api"):
+            self.apidict = (
+                load_api(self.api_spec, reports) if apidict is None else apidict
+            )
+        # Entities are resolved in place, so a given CT dictionary is copied to
+        # keep it reusable.
+        with self.phase("load_ct"):
+            if entdict is None:
+                self.codelists = {}
+                self.entdict = load_ct(self.ct_file, reports, self.codelists)
+            else:
+                self.codelists = codelists or {}
+                self.entdict = deepcopy(entdict)
+
+    def set_model(self, model: dict):
+        self.usdmxmi = model["usdmxmi"]
+        self.apidict = model["apidict"]
+        self.entdict = model["entdict"]
+        self.codelists = model["codelists"]
+        self.class_graph = ClassGraph(self.usdmxmi)
+        self.subtrees.clear()
+        self.api_elements.clear()
+        self.usdmver = model["usdmver"]
+        self.load_reports = model["reports"]
+        self.diagnostics = Diagnostics(self.load_reports)
+
+    @property
+    def model(self) -> dict:
+        return {
+            "reports": self.load_reports,
+            "usdmxmi": self.usdmxmi,
+            "apidict": self.apidict,
+            "entdict": self.entdict,
+            "codelists": self.codelists,
+            "usdmver": self.usdmver,
+        }
+
+    def get_entity_properties(self, entName: str) -> tuple:
+        # Returns the columns of the entity worksheet (or None if the entity has
+        # no matching class) together with the reports made for the entity, so
+        # that entities can be processed in any order or process and reported
+        # in sheet order.
+        prps = None
+        with self.collect_reports() as reports:
+            cls = self.usdmxmi.get_class(entName)
+            if cls:
+                prps = ColumnSpec(
+                    [
+                        ["parent_entity", "Parent Entity Name", "String", "[1]"],
+                        ["parent_id", "Parent Entity Id", "String", "[1]"],
+                        [
+                            "parent_rel",
+                            "Name of Relationship from Parent Entity",
+                            "String",
+                            "[1]",
+                        ],
+                        ["rel_type", "Type of Relationship", "String", "[1]"],
+                    ]
+                )
+                self.get_properties(entName, cls, prps)
+                self.check_entity_members(entName, cls)
+            else:
+                self.check_entity_class(entName)
+        return prps, reports
+
+    def check_entity_class(self, entName: str):
+        self.report(
+            "entity_not_in_xmi",
+            entName,
+            None,
+            f"Entity '{entName}' defined in {{ct_file}} does not have a "
+            + "matching class in {xmi_file}",
+        )
+
+    def check_entity_members(self, entName: str, cls: UmlClass):
+        for prpv in (
+            v
+            for k, v in self.entdict[entName]["Properties"].items()
+            if not (
+                self.usdmxmi.has_member(cls, k)
+                or (
+                    self.usdmxmi.get_general(cls)
+                    and self.usdmxmi.has_member(self.usdmxmi.get_general(cls), k)
+                )
+            )
+        ):
+            self.report(
+                "member_not_in_xmi",
+                entName,
+                prpv["name"],
+                f"{prpv['Role']} '{entName}.{prpv['name']}' defined in "
+                + "{ct_file} does not have a matching attribute or "
+                + "relationship in {xmi_file}",
+            )
+
+    def check_classes(self):
+        for cls in (
+            x
+            for x in self.usdmxmi.classes
+            if x.name not in self.entdict
+            and self.usdmxmi.get_element(x).isAbstract == "false"
+            and x.name in self.apidict
+        ):
+            self.report(
+                "class_not_in_ct",
+                cls.name,
+                None,
+                f"USDM class '{cls.name}' defined in {{xmi_file}} does not "
+                + "have a matching Entity in {ct_file}",
+            )
+
+    def check_entity(self, entName: str, cls: UmlClass):
+        # Reports the same inconsistencies as computing the columns of the
+        # entity worksheet, without expanding the linked classes (which are
+        # checked as entities of their own).
+        for vcls, descName, attributes, links in self.class_graph.get_plan(cls):
+            for prp, attr in attributes:
+                if attr.upper == "1":
+                    self.get_description(descName or entName, prp.name)
+            if vcls is cls:
+                for prp in self.get_api_only_attributes(entName):
+                    self.report_api_only_attribute(entName, prp)
+            for lnk, _ in links:
+                if lnk.name not in self.entdict[entName]["Properties"]:
+                    self.report_relationship(entName, lnk.name)
+        self.check_entity_members(entName, cls)
+
+    def check(self) -> list:
+        # Reconciles the XMI, CT and API definitions without computing the
+        # entity worksheets, and returns the inconsistencies found.
+        with self.collect_reports() as reports, self.phase("check"):
+            for entName in self.entdict:
+                cls = self.usdmxmi.get_class(entName)
+                if cls:
+                    self.check_entity(entName, cls)
+                else:
+                    self.check_entity_class(entName)
+            self.check_classes()
+        self.diagnostics = Diagnostics(self.load_reports)
+        self.diagnostics.extend(reports)
+        return self.diagnostics.get_findings()
+
+    def get_entity_fingerprint(self, entName: str) -> str:
+        cls = self.usdmxmi.get_class(entName)
+        return get_fingerprint(
+            entName,
+            self.entdict[entName],
+            self.apidict.get(entName),
+            [
+                (
+                    vcls,
+                    [self.usdmxmi.get_attribute(prp) for prp in vcls.properties],
+                    [
+                        (
+                            lnk,
+                            self.usdmxmi.get_target(lnk)
+                            and self.usdmxmi.get_target(lnk).name,
+                        )
+                        for lnk in self.usdmxmi.get_links(vcls)
+                    ],
+                    self.entdict.get(vcls.name),
+                )
+                for vcls in (self.get_expanded_classes(cls) if cls else [])
+            ],
+            self.max_depth,
+        )
+
+    def get_profiled_entity_properties(self, entName: str) -> tuple:
+        with self.profiler.entity(entName) as stats:
+            prps, reports = self.get_entity_properties(entName)
+            stats["columns"] = len(prps) if prps else 0
+        return prps, reports
+
+    def get_all_entity_properties(self, entNames: list, jobs: int):
+        # Entities are profiled in the main process only.
+        if jobs > 1 and not self.profiler:
+            with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=init_worker,
+                initargs=(self,),
+            ) as pool:
+                yield from pool.map(
+                    get_worker_entity_properties,
+                    entNames,
+                    chunksize=max(1, len(entNames) // (jobs * 4)),
+                )
+        elif self.profiler:
+            yield from map(self.get_profiled_entity_properties, entNames)
+        else:
+            yield from map(self.get_entity_properties, entNames)
+
+    def get_incremental_entity_properties(
+        self, fingerprints_file: str, jobs: int
+    ) -> dict:
+        # Reuses the columns stored by the previous run for entities whose inputs
+        # are unchanged, and recomputes those of all other entities.
+        previous = read_fingerprints(fingerprints_file)
+        fingerprints = {
+            entName: self.get_entity_fingerprint(entName) for entName in self.entdict
+        }
+        changed = [
+            entName
+            for entName in self.entdict
+            if entName not in previous
+            or previous[entName]["fingerprint"] != fingerprints[entName]
+        ]
+        entprps = {
+            entName: (
+                (
+                    ColumnSpec(previous[entName]["properties"])
+                    if previous[entName]["properties"] is not None
+                    else None
+                ),
+                previous[entName]["reports"],
+            )
+            for entName in self.entdict
+            if entName not in changed
+        }
+        entprps.update(zip(changed, self.get_all_entity_properties(changed, jobs)))
+        self.report(
+            "worksheets_changed",
+            None,
+            None,
+            (
+                "Worksheets changed since the previous run: "
+                + ", ".join(get_sheet_name(x) for x in changed)
+                if changed
+                else "No worksheets changed since the previous run"
+            ),
+        )
+        if any(x not in self.entdict for x in previous):
+            self.report(
+                "worksheets_removed",
+                None,
+                None,
+                "Worksheets removed since the previous run: "
+                + ", ".join(
+                    get_sheet_name(x) for x in previous if x not in self.entdict
+                ),
+            )
+        return {
+            entName: {
+                "fingerprint": fingerprints[entName],
+                "properties": (
+                    entprps[entName][0].to_list()
+                    if entprps[entName][0] is not None
+                    else None
+                ),
+                "reports": entprps[entName][1],
+            }
+            for entName in self.entdict
+        }
+
+    def write_template(self, output, entprps, documents=(), rows=None):
+        # Documents, given as (file name, USDM JSON document) pairs, are
+        # flattened into rows of the worksheets, or rows are given by dataset
+        # name (as spooled by prefill.spool_rows). They are written in constant
+        # memory mode, which flushes each row to a temporary file once the next
+        # row of the worksheet is written, unless writing to a buffer.
+        import xlsxwriter
+
+        workbook = xlsxwriter.Workbook(
+            output,
+            (
+                {"constant_memory": bool(documents or rows)}
+                if isinstance(output, str)
+                else {"in_memory": True}
+            ),
+        )
+        workbook.set_custom_property("USDM Version", str(self.usdmver))
+
+        header = workbook.add_format(HEADER_FORMAT)
+        sub_header = workbook.add_format(SUB_HEADER_FORMAT)
+        normal = workbook.add_format(NORMAL_FORMAT)
+
+        dsws = workbook.add_worksheet("Datasets")
+        dsprps = ["Filename", "Dataset Name", "Label"]
+        dsws.set_column(0, len(dsprps), 30)
+        dsws.write_row(0, 0, dsprps, header)
+
+        clsn = 0
+        # Worksheets and the number of the next row to write by dataset name,
+        # and layouts of the entity worksheets to flatten documents into.
+        sheets = {}
+        layouts = {}
+        codelist_columns = []
+
+        for entName, (prps, reports) in zip(self.entdict.keys(), entprps):
+            self.diagnostics.extend(reports)
+            if prps:
+                clsn += 1
+                clsSheet = get_sheet_name(entName)
+                dsws.write_url(clsn, 0, f"internal:'{clsSheet}'!A1", string=clsSheet)
+                dsws.write_row(
+                    clsn, 1, [entName, self.entdict[entName]["Preferred Name"]]
+                )
+                ws = workbook.add_worksheet(clsSheet)
+                ws.set_column(0, len(prps), 25)
+                for i, col in enumerate(prps):
+                    ws.write(0, i, col.name, header)
+                for i, col in enumerate(prps):
+                    ws.write(1, i, col.description, sub_header)
+                for i, col in enumerate(prps):
+                    ws.write(2, i, col.type, sub_header)
+                for i, col in enumerate(prps):
+                    ws.write(3, i, col.cardinality, sub_header)
+                sheets[entName] = [ws, 4, len(prps)]
+                layouts[entName] = get_layout(entName, prps)
+                codelist_columns.append((ws, self.get_codelist_columns(entName, prps)))
+
+        with self.collect_reports() as reports:
+            self.check_classes()
+        self.diagnostics.extend(reports)
+
+        for pdtype in VALUE_TYPES:
+            clsn += 1
+            dsname = pdtype.lower()
+            dsws.write_url(
+                clsn, 0, f"internal:'{dsname}.xpt'!A1", string=f"{dsname}.xpt"
+            )
+            dsws.write_row(clsn, 1, [dsname, f"{pdtype} Values"])
+            ws = workbook.add_worksheet(f"{dsname}.xpt")
+            ws.set_column(0, 4, 25)
+            vcols = get_value_columns(pdtype)
+            ws.write_row(0, 0, [x.name for x in vcols], header)
+            ws.write_row(1, 0, [x.description for x in vcols], sub_header)
+            ws.write_row(2, 0, [x.type for x in vcols], sub_header)
+            ws.write_row(3, 0, [x.cardinality for x in vcols], sub_header)
+            sheets[dsname] = [ws, 4, len(vcols)]
+
+        self.write_codelists(workbook, codelist_columns, header)
+
+        with self.collect_reports() as reports:
+            self.write_documents(documents, sheets, layouts, normal)
+        self.diagnostics.extend(reports)
+        if rows:
+            self.write_rows(rows, sheets, normal)
+
+        for ws, row, ncols in sheets.values():
+            # Add a blank row with defined format to prevent auto-copying of
+            # format from row above.
+            ws.write_row(row, 0, [None] * ncols, normal)
+
+        workbook.close()
+
+    def get_codelist_columns(self, entName: str, prps: ColumnSpec) -> list:
+        # (column index, codelist, field) of the code and decode columns of the
+        # Code (or the standard code of an AliasCode) reached by a relationship
+        # with a codelist reference. The classes on the path of a column are
+        # read from its cardinality, e.g. StudyArm[1]>Code[0..1].code[1].
+        columns = []
+        for i, col in enumerate(prps):
+            path = col.name.split(".")
+            match = re.match(r"(.*)\.\w+\[[^\[\]]*\]$", col.cardinality)
+            if path[-1] not in CODE_FIELDS or not match:
+                continue
+            owners = [entName] + [x.split("[")[0] for x in match.group(1).split(">")]
+            for n in range(len(path) - 2, len(path) - 4, -1):
+                if n < 0 or len(owners) != len(path):
+                    break
+                prpDef = self.entdict.get(owners[n], {"Properties": {}})[
+                    "Properties"
+                ].get(path[n])
+                if prpDef and prpDef["CodelistRef"]:
+                    columns.append((i, prpDef["CodelistRef"], path[-1]))
+                    break
+        return columns
+
+    def write_codelists(self, workbook, columns: list, format):
+        # Each codelist used by a code or decode column is written once, to a
+        # hidden sheet with a defined name for its codes and one for its
+        # decodes. Each such column gets a single list validation of all its
+        # data rows referring to the name, so the workbook does not grow with
+        # the number of rows or coded columns.
+        from xlsxwriter.utility import xl_range_abs
+
+        used = {}
+        for ws, wscols in columns:
+            for i, cref, field in wscols:
+                if not self.codelists.get(cref):
+                    continue
+                used.setdefault(cref, len(used))
+                ws.data_validation(
+                    4,
+                    i,
+                    MAX_ROW,
+                    i,
+                    {
+                        "validate": "list",
+                        "source": "=" + get_codelist_name(cref, field),
+                        "error_type": "warning",
+                        "error_title": f"Codelist {cref}",
+                        "error_message": f"The value is not a {field} of "
+                        + f"codelist {cref}.",
+                    },
+                )
+        if not used:
+            return
+        # Rows are written in order, as required in constant memory mode.
+        clws = workbook.add_worksheet(CODELISTS_SHEET)
+        clws.hide()
+        clws.write_row(
+            0, 0, [f"{cref} {field}" for cref in used for field in CODE_FIELDS], format
+        )
+        for r in range(max(len(self.codelists[x]) for x in used)):
+            clws.write_row(
+                r + 1,
+                0,
+                [
+                    self.codelists[cref][r][j]
+                    if r < len(self.codelists[cref])
+                    else None
+                    for cref in used
+                    for j in range(len(CODE_FIELDS))
+                ],
+            )
+        for cref, n in used.items():
+            for j, field in enumerate(CODE_FIELDS):
+                col = n * len(CODE_FIELDS) + j
+                workbook.define_name(
+                    get_codelist_name(cref, field),
+                    f"='{CODELISTS_SHEET}'!"
+                    + xl_range_abs(1, col, len(self.codelists[cref]), col),
+                )
+
+    def write_documents(self, documents, sheets: dict, layouts: dict, format):
+        flattener = DocumentFlattener(layouts, self.report)
+        for json_file, document in documents:
+            for dsname, row in flattener.get_rows(json_file, document):
+                sheet = sheets[dsname]
+                sheet[0].write_row(sheet[1], 0, row, format)
+                sheet[1] += 1
+
+    def write_rows(self, rows, sheets: dict, format):
+        for dsname, sheet in sheets.items():
+            for row in rows.get(dsname, ()):
+                sheet[0].write_row(sheet[1], 0, row, format)
+                sheet[1] += 1
+
+    def write_datasets(
+        self,
+        output_dir: str,
+        format: str = "xpt",
+        jobs: int = 1,
+        rows: dict = None,
+        documents=(),
+        entprps: list = None,
+    ) -> str:
+        # Writes each entity worksheet and value sheet as a dataset file of the
+        # given format (see dataset_writer), together with a datasets.json
+        # manifest in place of the Datasets sheet, to the output directory,
+        # whose name may contain a <USDM version> placeholder. Rows can be given
+        # by dataset name, or flattened from (file name, USDM JSON document)
+        # pairs as in write_template, and the columns of the entity worksheets
+        # if already computed. Returns the manifest file name.
+        output_dir = output_dir.replace("<USDM version>", self.usdmver)
+        os.makedirs(output_dir, exist_ok=True)
+        self.diagnostics = Diagnostics(self.load_reports)
+        if entprps is None:
+            entprps = self.get_all_entity_properties(list(self.entdict.keys()), jobs)
+            if self.profiler or documents:
+                # Documents are flattened with the layouts of all entity
+                # worksheets before the first dataset is written.
+                with self.phase("columns"):
+                    entprps = list(entprps)
+        with self.phase("write"):
+            with self.collect_reports() as reports, (
+                spool_rows(self.flatten_documents(entprps, documents))
+                if documents
+                else nullcontext(rows or {})
+            ) as rows:
+                datasets = self.write_dataset_files(output_dir, format, entprps, rows)
+            self.diagnostics.extend(reports)
+            manifest_file = os.path.join(output_dir, "datasets.json")
+            with open(manifest_file, "w") as f:
+                json.dump(
+                    {"usdmVersion": self.usdmver, "datasets": datasets}, f, indent=1
+                )
+        return manifest_file
+
+    def flatten_documents(self, entprps: list, documents):
+        # Yields the (dataset name, row) pairs of the documents.
+        flattener = DocumentFlattener(
+            {
+                entName: get_layout(entName, prps)
+                for entName, (prps, _) in zip(self.entdict.keys(), entprps)
+                if prps
+            },
+            self.report,
+        )
+        for json_file, document in documents:
+            yield from flattener.get_rows(json_file, document)
+
+    def write_dataset_files(
+        self, output_dir: str, format: str, entprps, rows: dict
+    ) -> list:
+        # Returns the manifest entries of the datasets written.
+        datasets = []
+        for entName, (prps, reports) in zip(self.entdict.keys(), entprps):
+            self.diagnostics.extend(reports)
+            if prps:
+                datasets.append(
+                    write_dataset(
+                        format,
+                        output_dir,
+                        entName,
+                        self.entdict[entName]["Preferred Name"] or "",
+                        prps,
+                        rows.get(entName, ()),
+                    )
+                )
+        with self.collect_reports() as reports:
+            self.check_classes()
+        self.diagnostics.extend(reports)
+        for pdtype in VALUE_TYPES:
+            datasets.append(
+                write_dataset(
+                    format,
+                    output_dir,
+                    pdtype.lower(),
+                    f"{pdtype} Values",
+                    get_value_columns(pdtype),
+                    rows.get(pdtype.lower(), ()),
+                )
+            )
+        return datasets
+
+    def get_column_specs(self, jobs: int = 1) -> dict:
+        entprps = {}
+        self.diagnostics = Diagnostics(self.load_reports)
+        with self.phase("columns"):
+            for entName, (prps, reports) in zip(
+                self.entdict.keys(),
+                self.get_all_entity_properties(list(self.entdict.keys()), jobs),
+            ):
+                self.diagnostics.extend(reports)
+                if prps:
+                    entprps[entName] = prps
+        return entprps
+
+    def write(
+        self,
+        output,
+        jobs: int = 1,
+        incremental: bool = False,
+        documents=(),
+        datasets_dir: str = None,
+        datasets_format: str = "xpt",
+    ):
+        # Writes the template to a file, whose name may contain a
+        # <USDM version> placeholder, or to a binary buffer, prefilled with the
+        # (file name, USDM JSON document) pairs given if any, and returns the
+        # file name or buffer written to. If a datasets directory is given, the
+        # dataset files (see write_datasets) are written from the same columns
+        # and documents.
+        if isinstance(output, str):
+            output = output.replace("<USDM version>", self.usdmver)
+        self.diagnostics = Diagnostics(self.load_reports)
+        entities = None
+        if incremental:
+            if not isinstance(output, str):
+                raise ValueError("Incremental generation requires an output file")
+            fingerprints_file = get_fingerprints_file(output)
+            with self.collect_reports() as reports, self.phase("columns"):
+                entities = self.get_incremental_entity_properties(
+                    fingerprints_file, jobs
+                )
+            self.diagnostics.extend(reports)
+            entprps = [
+                (
+                    ColumnSpec(x["properties"])
+                    if x["properties"] is not None
+                    else None,
+                    x["reports"],
+                )
+                for x in entities.values()
+            ]
+        else:
+            entprps = self.get_all_entity_properties(list(self.entdict.keys()), jobs)
+            # The worksheets are otherwise written as their columns are
+            # computed, which would not separate the two phases.
+            if self.profiler or datasets_dir:
+                with self.phase("columns"):
+                    entprps = list(entprps)
+        if datasets_dir:
+            self.write_template_and_datasets(
+                output, entprps, documents, datasets_dir, datasets_format
+            )
+        else:
+            with self.phase("write"):
+                self.write_template(output, entprps, documents)
+        if entities is not None:
+            write_fingerprints(fingerprints_file, entities)
+        return output
+
+    def write_template_and_datasets(
+        self, output, entprps: list, documents, datasets_dir: str, format: str
+    ):
+        # The documents are read and flattened once, into rows spooled for both
+        # the template and the dataset files.
+        with self.collect_reports() as reports, (
+            spool_rows(self.flatten_documents(entprps, documents))
+            if documents
+            else nullcontext({})
+        ) as rows:
+            with self.phase("write"):
+                self.write_template(output, entprps, rows=rows)
+            # The dataset files are written from the same columns, so their
+            # diagnostics are those of the template.
+            diagnostics = self.diagnostics
+            self.write_datasets(datasets_dir, format, rows=rows, entprps=entprps)
+            self.diagnostics = diagnostics
+        self.diagnostics.extend(reports)
+
+
+worker_generator = None
+
+
+def init_worker(generator: TemplateGenerator):
+    global worker_generator
+    worker_generator = generator
+
+
+def get_worker_entity_properties(entName: str) -> tuple:
+    return worker_generator.get_entity_properties(entName)
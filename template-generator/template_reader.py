@@ -0,0 +1,275 @@
+import json
+import os
+import re
+import sqlite3
+import tempfile
+from collections import deque
+from diagnostics import Diagnostics
+
+PARENT_COLUMNS = ("parent_entity", "parent_id", "parent_rel", "rel_type")
+
+# Types of the values in the primitive value sheets of a template.
+VALUE_SHEETS = {
+    "string.xpt": "String",
+    "float.xpt": "Float",
+    "boolean.xpt": "Boolean",
+    "null.xpt": "Null",
+}
+
+# Hidden sheet of the codelists of the code and decode columns.
+CODELISTS_SHEET = "Codelists"
+
+TRUE_VALUES = frozenset(("true", "t", "yes", "y", "1"))
+
+
+def to_value(value, type: str):
+    # Cells are formatted as text, so values are usually strings whatever the
+    # type of the column.
+    if value is None or value == "" or type == "Null":
+        return None
+    elif "Boolean" in type:
+        return value if isinstance(value, bool) else str(value).lower() in TRUE_VALUES
+    elif "Integer" in type:
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    elif "Float" in type or "Number" in type:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    elif isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    else:
+        return str(value)
+
+
+def get_class_name(cardinality: str) -> str:
+    # Class of a relationship column, e.g. Code in StudyArm[1]>Code[0..1].
+    match = re.search(r"([^>\[\]]+)\[[^\[\]]*\]$", cardinality or "")
+    return match.group(1) if match else None
+
+
+def get_sheets(workbook) -> dict:
+    # Entity names by sheet name, from the Datasets sheet.
+    sheets = {}
+    for row in workbook["Datasets"].iter_rows(min_row=2, values_only=True):
+        if len(row) > 1 and row[0] and row[1]:
+            sheets[row[0]] = row[1]
+    return sheets
+
+
+def get_key(entName: str, id) -> str:
+    return json.dumps([entName, to_value(id, "String")])
+
+
+class SheetLayout:
+    # The flattened columns of an entity worksheet, read from its header rows
+    # (names, descriptions, types and cardinalities), as (index, path, kind,
+    # type, class name) tuples where kind is "object" for single relationships,
+    # "list" for multiple values or relationships and "value" otherwise, and
+    # the class name is the target class of relationships.
+    __slots__ = ("entity", "columns")
+
+    def __init__(self, entity: str, header: list):
+        self.entity = entity
+        self.columns = []
+        names, descriptions, types, cards = (
+            list(x) + [None] * (len(header[0]) - len(x)) for x in header
+        )
+        for i, name in enumerate(names):
+            if not name or name in PARENT_COLUMNS:
+                continue
+            desc = descriptions[i] or ""
+            if desc.endswith(("[Any Exist]", "[Any Exists]")):
+                kind = "list"
+            elif desc.endswith("[Exists]"):
+                kind = "object"
+            else:
+                kind = "value"
+            relationship = desc.endswith(("[Exists]", "[Any Exists]"))
+            self.columns.append(
+                (
+                    i,
+                    tuple(name.split(".")),
+                    kind,
+                    types[i] or "String",
+                    get_class_name(cards[i]) if relationship else None,
+                )
+            )
+
+    def get_object(self, row: list) -> tuple:
+        # Un-flattens a row into an object, returning the object and the
+        # (class name, object) pairs of it and its nested objects. Nested
+        # columns are ignored unless their relationship column is set.
+        obj = {}
+        nodes = {(): obj}
+        objects = [(self.entity, obj)]
+        for i, path, kind, type, clsName in self.columns:
+            node = nodes.get(path[:-1])
+            if node is None:
+                continue
+            value = row[i] if i < len(row) else None
+            if kind == "object":
+                if to_value(value, "Boolean"):
+                    nodes[path] = node[path[-1]] = {}
+                    objects.append((clsName, nodes[path]))
+                else:
+                    node[path[-1]] = None
+            elif kind == "list":
+                node[path[-1]] = []
+            else:
+                node[path[-1]] = to_value(value, type)
+        return obj, objects
+
+
+class TemplateReader:
+    # Reads a filled test data template back into USDM JSON documents, one for
+    # each row without a parent entity. Rows are spooled to a temporary SQLite
+    # database indexed by parent, so that only one document at a time is held
+    # in memory however many rows the workbook contains.
+    def __init__(self, template_file: str):
+        self.template_file = template_file
+        self.diagnostics = Diagnostics()
+        self.usdmver = None
+        self.layouts = []
+
+    @property
+    def files(self) -> dict:
+        return {"template_file": self.template_file}
+
+    def report(self, kind: str, entity: str, attribute: str, message: str):
+        self.diagnostics.add(kind, entity, attribute, message)
+
+    def spool(self, db: sqlite3.Connection):
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(
+            filename=self.template_file, read_only=True, data_only=True
+        )
+        try:
+            if "USDM Version" in workbook.custom_doc_props.names:
+                self.usdmver = workbook.custom_doc_props["USDM Version"].value
+            sheets = get_sheets(workbook)
+            for sheet in workbook.sheetnames:
+                if sheet in ("Datasets", CODELISTS_SHEET):
+                    continue
+                elif sheet not in sheets and sheet not in VALUE_SHEETS:
+                    self.report(
+                        "unknown_sheet",
+                        None,
+                        sheet,
+                        f"Sheet '{sheet}' of {{template_file}} is not listed in "
+                        + "the Datasets sheet",
+                    )
+                    continue
+                rows = workbook[sheet].iter_rows(values_only=True)
+                header = [x for _, x in zip(range(4), rows)]
+                # Rows refer to the layout of an entity sheet by its index and
+                # to a value sheet by the type of its values.
+                # The value sheets are also listed in the Datasets sheet.
+                if sheet in VALUE_SHEETS:
+                    ref = VALUE_SHEETS[sheet]
+                else:
+                    self.layouts.append(SheetLayout(sheets[sheet], header))
+                    ref = len(self.layouts) - 1
+                db.executemany(
+                    "INSERT INTO rows (parent, sheet, data) VALUES (?, ?, ?)",
+                    (
+                        (
+                            get_key(row[0], row[1]) if row[0] else "",
+                            ref,
+                            json.dumps(row, default=str),
+                        )
+                        for row in rows
+                        if any(x is not None and x != "" for x in row)
+                    ),
+                )
+        finally:
+            workbook.close()
+
+    def attach(self, db: sqlite3.Connection, key: str, obj: dict, queue: deque):
+        # Adds the rows whose parent is the object with the given key to the
+        # object, queueing the objects created for their own children.
+        rows = db.execute(
+            "SELECT sheet, data FROM rows WHERE parent = ? ORDER BY seq", (key,)
+        ).fetchall()
+        for sheet, data in rows:
+            row = json.loads(data)
+            rel = row[2]
+            if not rel:
+                continue
+            if isinstance(sheet, int):
+                value, objects = self.layouts[sheet].get_object(row)
+                queue.extend(objects)
+            else:
+                value = to_value(row[4] if len(row) > 4 else None, sheet)
+            if isinstance(obj.get(rel), list):
+                obj[rel].append(value)
+            elif rel in obj and obj[rel] is not None:
+                obj[rel] = [obj[rel], value]
+            else:
+                obj[rel] = value
+        db.execute("DELETE FROM rows WHERE parent = ?", (key,))
+
+    def get_document(self, db: sqlite3.Connection, sheet: int, row: list) -> dict:
+        obj, objects = self.layouts[sheet].get_object(row)
+        queue = deque(objects)
+        while queue:
+            clsName, vobj = queue.popleft()
+            if clsName and vobj.get("id") is not None:
+                self.attach(db, get_key(clsName, vobj["id"]), vobj, queue)
+        entName = self.layouts[sheet].entity
+        return {
+            entName[0].lower() + entName[1:]: obj,
+            "usdmVersion": self.usdmver,
+        }
+
+    def read(self):
+        # Yields the USDM JSON documents of the template in row order.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = sqlite3.connect(os.path.join(tmpdir, "rows.db"))
+            try:
+                db.execute(
+                    "CREATE TABLE rows (seq INTEGER PRIMARY KEY, parent TEXT, "
+                    + "sheet, data TEXT)"
+                )
+                db.execute("CREATE INDEX rows_parent ON rows (parent)")
+                self.spool(db)
+                roots = [
+                    x[0]
+                    for x in db.execute(
+                        "SELECT seq FROM rows WHERE parent = '' ORDER BY seq"
+                    )
+                ]
+                for seq in roots:
+                    sheet, data = db.execute(
+                        "SELECT sheet, data FROM rows WHERE seq = ?", (seq,)
+                    ).fetchone()
+                    if isinstance(sheet, int):
+                        yield self.get_document(db, sheet, json.loads(data))
+                    else:
+                        self.report(
+                            "value_without_parent",
+                            None,
+                            None,
+                            "Value row in {template_file} has no parent entity",
+                        )
+                self.check_orphans(db)
+            finally:
+                db.close()
+
+    def check_orphans(self, db: sqlite3.Connection):
+        for parent, count in db.execute(
+            "SELECT parent, count(*) FROM rows WHERE parent != '' GROUP BY parent "
+            + "ORDER BY min(seq)"
+        ):
+            entName, id = json.loads(parent)
+            self.report(
+                "parent_not_found",
+                entName,
+                id,
+                f"{count} rows in {{template_file}} refer to parent {entName} "
+                + f"'{id}', which is not found",
+            )
@@ -0,0 +1,322 @@
+import re
+from itertools import islice
+from typing import NamedTuple
+from diagnostics import Diagnostics
+from template_reader import (
+    CODELISTS_SHEET,
+    PARENT_COLUMNS,
+    TRUE_VALUES,
+    VALUE_SHEETS,
+    SheetLayout,
+    get_sheets,
+    to_value,
+)
+
+# Number of rows read before their columns are validated.
+BATCH_ROWS = 2000
+
+FALSE_VALUES = frozenset(("false", "f", "no", "n", "0"))
+
+INTEGER_PATTERN = re.compile(r"\s*[+-]?\d+\s*")
+
+
+def is_boolean(value) -> bool:
+    return isinstance(value, bool) or str(value).lower() in TRUE_VALUES | FALSE_VALUES
+
+
+def is_integer(value) -> bool:
+    if isinstance(value, float):
+        return value.is_integer()
+    return isinstance(value, int) or bool(INTEGER_PATTERN.fullmatch(str(value)))
+
+
+def is_float(value) -> bool:
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def is_null(value) -> bool:
+    return False
+
+
+def get_type_check(type: str):
+    # Returns the function validating non-empty values of the type, or None if
+    # any value is valid (e.g. for String or a union of String and another
+    # type).
+    if "String" in type:
+        return None
+    elif "Boolean" in type:
+        return is_boolean
+    elif "Integer" in type:
+        return is_integer
+    elif "Float" in type or "Number" in type:
+        return is_float
+    elif type == "Null":
+        return is_null
+    else:
+        return None
+
+
+def is_required(description: str, cardinality: str) -> bool:
+    # Alternative cardinalities of a column are separated by " / ", and those of
+    # identifier columns end with the cardinality of the id of the referenced
+    # class rather than of the reference.
+    identifier = description.endswith(("[Identifier]", "[Identifiers][Any Exist]"))
+    for card in (cardinality or "").split(" / "):
+        if identifier and card.endswith(".id[1]"):
+            card = card[: -len(".id[1]")]
+        match = re.search(r"\[(\d+)(?:\.\.[^\[\]]*)?\]$", card)
+        if not match or match.group(1) == "0":
+            return False
+    return True
+
+
+def is_empty(value) -> bool:
+    return value is None or value == ""
+
+
+class ColumnCheck(NamedTuple):
+    index: int
+    name: str
+    path: tuple
+    kind: str
+    type: str
+    required: bool
+    valid: object
+
+
+class SheetChecks:
+    # The checks of the columns of a worksheet, compiled once from its header
+    # rows. The nested columns of a single relationship are only required when
+    # its [Exists] column is set.
+    __slots__ = ("sheet", "entity", "checks", "parent", "ids", "relationships")
+
+    def __init__(self, sheet: str, entity: str, header: list):
+        self.sheet = sheet
+        self.entity = entity
+        self.checks = []
+        names, descriptions, types, cards = (
+            list(x) + [None] * (len(header[0]) - len(x)) for x in header
+        )
+        if sheet in VALUE_SHEETS:
+            # The value column of a value sheet is typed by the sheet.
+            types = [VALUE_SHEETS[sheet] if x == "value" else None for x in names]
+        layout = SheetLayout(entity, header)
+        for i, path, kind, type, clsName in layout.columns:
+            self.checks.append(
+                ColumnCheck(
+                    i,
+                    names[i],
+                    path,
+                    kind,
+                    type,
+                    is_required(descriptions[i] or "", cards[i]),
+                    get_type_check(types[i] or type),
+                )
+            )
+        columns = {x: i for i, x in enumerate(names) if x}
+        self.parent = [columns.get(x) for x in PARENT_COLUMNS[:3]]
+        # Classes of the objects of a row by their path, with the columns
+        # holding their ids and the names of their multiple values and
+        # relationships, which may be the parent_rel of other rows.
+        classes = {(): None if sheet in VALUE_SHEETS else entity}
+        classes.update((x[1], x[4]) for x in layout.columns if x[2] == "object")
+        self.ids = [
+            (clsName, columns[".".join(path + ("id",))])
+            for path, clsName in classes.items()
+            if clsName and ".".join(path + ("id",)) in columns
+        ]
+        self.relationships = [
+            (classes.get(path[:-1]), path[-1])
+            for _, path, kind, _, _ in layout.columns
+            if kind == "list"
+        ]
+
+
+class TemplateValidator:
+    # Validates the test data in a filled template against the types and
+    # cardinalities in the header rows of its worksheets, and checks that the
+    # parent_entity and parent_id of each row refer to an object of the
+    # workbook. Rows are streamed and validated column by column in batches,
+    # so that only the ids of the objects (and of missing parents) are held in
+    # memory.
+    def __init__(self, template_file: str):
+        self.template_file = template_file
+        self.diagnostics = Diagnostics()
+        self.objects = {}
+        self.parents = {}
+        self.relationships = set()
+        self.parent_relationships = {}
+
+    @property
+    def files(self) -> dict:
+        return {"template_file": self.template_file}
+
+    def report(self, kind: str, entity: str, attribute: str, message: str):
+        self.diagnostics.add(kind, entity, attribute, message)
+
+    def validate(self) -> list:
+        # Returns the inconsistencies found.
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(
+            filename=self.template_file, read_only=True, data_only=True
+        )
+        try:
+            sheets = get_sheets(workbook)
+            for sheet in workbook.sheetnames:
+                if sheet in ("Datasets", CODELISTS_SHEET):
+                    continue
+                elif sheet not in sheets and sheet not in VALUE_SHEETS:
+                    self.report(
+                        "unknown_sheet",
+                        None,
+                        sheet,
+                        f"Sheet '{sheet}' of {{template_file}} is not listed in "
+                        + "the Datasets sheet",
+                    )
+                    continue
+                self.validate_sheet(workbook[sheet], sheets.get(sheet, sheet))
+        finally:
+            workbook.close()
+        self.check_parents()
+        return self.diagnostics.get_findings()
+
+    def validate_sheet(self, worksheet, entity: str):
+        rows = worksheet.iter_rows(values_only=True)
+        header = [x for _, x in zip(range(4), rows)]
+        if len(header) < 4:
+            return
+        checks = SheetChecks(worksheet.title, entity, header)
+        self.relationships.update(checks.relationships)
+        ncols = len(header[0])
+        first = 5
+        for chunk in iter(lambda: list(islice(rows, BATCH_ROWS)), []):
+            # Blank rows are skipped, keeping the row numbers of the others.
+            numbers, batch = [], []
+            for n, row in enumerate(chunk, first):
+                if any(not is_empty(x) for x in row):
+                    numbers.append(n)
+                    batch.append(row + (None,) * (ncols - len(row)))
+            first += len(chunk)
+            if batch:
+                columns = list(zip(*batch))
+                self.validate_columns(checks, columns, numbers)
+                self.index_objects(checks, columns, numbers)
+                self.index_parents(checks, columns, numbers)
+
+    def validate_columns(self, checks: SheetChecks, columns: list, numbers: list):
+        # Whether each nested object exists, by its path, for the rows of the
+        # batch (None for the objects of the rows themselves).
+        exists = {(): None}
+        for check in checks.checks:
+            if check.path[:-1] not in exists:
+                continue
+            present = exists[check.path[:-1]]
+            values = columns[check.index]
+            if check.valid:
+                for r, value in enumerate(values):
+                    if not is_empty(value) and not check.valid(value):
+                        self.report_value(checks, check, numbers[r], value)
+            if check.required:
+                for r, value in enumerate(values):
+                    if (present is None or present[r]) and (
+                        is_empty(value)
+                        or check.kind != "value"
+                        and not to_value(value, "Boolean")
+                    ):
+                        self.report_missing(checks, check, numbers[r])
+            if check.kind == "object":
+                exists[check.path] = [
+                    (present is None or present[r]) and to_value(value, "Boolean")
+                    for r, value in enumerate(values)
+                ]
+
+    def report_value(self, checks: SheetChecks, check: ColumnCheck, row, value):
+        self.report(
+            "invalid_value",
+            checks.entity,
+            check.name,
+            f"Value '{value}' of column '{check.name}' in row {row} of sheet "
+            + f"'{checks.sheet}' of {{template_file}} is not a valid {check.type}",
+        )
+
+    def report_missing(self, checks: SheetChecks, check: ColumnCheck, row: int):
+        self.report(
+            "missing_value",
+            checks.entity,
+            check.name,
+            f"Required column '{check.name}' in row {row} of sheet "
+            + f"'{checks.sheet}' of {{template_file}} is not set",
+        )
+
+    def index_objects(self, checks: SheetChecks, columns: list, numbers: list):
+        for clsName, i in checks.ids:
+            for r, id in enumerate(columns[i]):
+                if is_empty(id):
+                    continue
+                key = (clsName, to_value(id, "String"))
+                if key in self.objects:
+                    self.report(
+                        "duplicate_id",
+                        clsName,
+                        key[1],
+                        f"{clsName} '{key[1]}' in row {numbers[r]} of sheet "
+                        + f"'{checks.sheet}' of {{template_file}} is also in "
+                        + "row {} of sheet '{}'".format(*self.objects[key]),
+                    )
+                else:
+                    self.objects[key] = (numbers[r], checks.sheet)
+
+    def index_parents(self, checks: SheetChecks, columns: list, numbers: list):
+        # Parents are looked up once all objects are indexed, so only the first
+        # row and the number of rows referring to each parent (and parent
+        # relationship) are kept.
+        entity, id, rel = checks.parent
+        if entity is None or id is None:
+            return
+        for r, (parent, parent_id, parent_rel) in enumerate(
+            zip(
+                columns[entity],
+                columns[id],
+                columns[rel] if rel is not None else [None] * len(numbers),
+            )
+        ):
+            if is_empty(parent):
+                continue
+            for refs, key in (
+                (self.parents, (parent, to_value(parent_id, "String"))),
+                (self.parent_relationships, (parent, parent_rel)),
+            ):
+                if key in refs:
+                    refs[key][2] += 1
+                else:
+                    refs[key] = [numbers[r], checks.sheet, 1]
+
+    def check_parents(self):
+        for (entity, id), (row, sheet, count) in self.parents.items():
+            if (entity, id) not in self.objects:
+                self.report(
+                    "parent_not_found",
+                    entity,
+                    id,
+                    f"{count} rows in {{template_file}} (first in row {row} of "
+                    + f"sheet '{sheet}') refer to parent {entity} '{id}', which "
+                    + "is not found",
+                )
+        for (entity, rel), (row, sheet, count) in self.parent_relationships.items():
+            if (entity, rel) not in self.relationships:
+                self.report(
+                    "unknown_parent_relationship",
+                    entity,
+                    rel,
+                    f"{count} rows in {{template_file}} (first in row {row} of "
+                    + f"sheet '{sheet}') refer to relationship '{entity}.{rel}', "
+                    + "which is not a multiple value or relationship in the "
+                    + "template",
+                )
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmark"))
+
+from synthetic_model import write_model  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def model_files(tmp_path_factory) -> tuple:
+    # XMI, CT and API files of a synthetic model with circular relationships
+    # and generalizations.
+    return write_model(str(tmp_path_factory.mktemp("model")), 12, cycles=3)
@@ -0,0 +1,70 @@
+import argparse
+import json
+import pytest
+from create_template import check_outputs, read_manifest
+
+
+def get_versions(model_files: tuple, tmp_path, entries: list, **options) -> list:
+    manifest = str(tmp_path / "manifest.json")
+    with open(manifest, "w") as f:
+        json.dump(
+            [
+                {
+                    k: v
+                    for k, v in dict(
+                        zip(("xmi_file", "ct_file", "api_spec"), model_files), **x
+                    ).items()
+                    if v is not None
+                }
+                for x in entries
+            ],
+            f,
+        )
+    batch_args = argparse.Namespace(
+        batch=manifest,
+        release=None,
+        xmi_file=None,
+        ct_file=None,
+        api_spec=None,
+        output_file="USDM_<USDM version>_Test_Data_Template.xlsx",
+        report_file=None,
+        datasets_dir=None,
+        profile=None,
+        check=False,
+        datasets_only=False,
+    )
+    vars(batch_args).update(options)
+    return read_manifest(batch_args)
+
+
+def test_distinct_outputs(model_files, tmp_path):
+    versions = get_versions(
+        model_files, tmp_path, [{"output_file": "a.xlsx"}, {"output_file": "b.xlsx"}]
+    )
+    check_outputs("manifest.json", versions)
+
+
+@pytest.mark.parametrize(
+    "entries,options",
+    [
+        ([{}, {}], {}),
+        ([{"output_file": "a.xlsx"}, {"output_file": "a.xlsx"}], {}),
+        (
+            [{"output_file": "a.xlsx"}, {"output_file": "b.xlsx"}],
+            {"datasets_dir": "USDM_<USDM version>_Datasets"},
+        ),
+        (
+            [{"output_file": "a.xlsx"}, {"output_file": "b.xlsx"}],
+            {"report_file": "USDM_<USDM version>_Report.json"},
+        ),
+    ],
+)
+def test_same_outputs(model_files, tmp_path, entries, options):
+    versions = get_versions(model_files, tmp_path, entries, **options)
+    with pytest.raises(ValueError, match="Entries 1 and 2 .* both write"):
+        check_outputs("manifest.json", versions)
+
+
+def test_missing_input(model_files, tmp_path):
+    with pytest.raises(ValueError, match="does not specify api_spec"):
+        get_versions(model_files, tmp_path, [{"api_spec": None}])
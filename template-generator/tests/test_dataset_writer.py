@@ -0,0 +1,51 @@
+import struct
+from column_spec import ColumnSpec
+from dataset_writer import write_xpt
+
+NAMESTR = ">hhhh8s40s8shhh2s8shhl52s"
+
+
+def from_ibm_float(data: bytes) -> float:
+    if data == b"." + b"\0" * 7:
+        return None
+    (value,) = struct.unpack(">Q", data)
+    fraction = (value & (2**56 - 1)) / 2**56
+    result = fraction * 16.0 ** (((value >> 56) & 0x7F) - 64)
+    return -result if value >> 63 else result
+
+
+def test_xpt_layout(tmp_path):
+    path = str(tmp_path / "Étude.xpt")
+    columns = ColumnSpec(
+        [
+            ["id", "Étude id", "String", "[1]"],
+            ["amountValue", "Amount", "Float", "[0..1]"],
+        ]
+    )
+    text = "é" * 150
+    write_xpt(path, "Étude", "Étude – Überblick", columns, [[text, "-2.5"], ["x"]])
+    with open(path, "rb") as f:
+        data = f.read()
+    records = [data[i : i + 80] for i in range(0, 640, 80)]
+    assert records[0].startswith(b"HEADER RECORD*******LIBRARY HEADER RECORD!!!!!!!")
+    assert records[1][:24] == b"SAS     SAS     SASLIB  "
+    assert records[3].startswith(b"HEADER RECORD*******MEMBER  HEADER RECORD!!!!!!!")
+    assert records[3][75:78] == b"140"
+    assert records[5][8:16] == b"_tude   "
+    assert records[6][32:72] == "Étude ? Überblick".ljust(40).encode("latin-1")
+    assert records[7][54:58] == b"0002"
+    namestrs = [
+        struct.unpack(NAMESTR, data[640 + i * 140 : 780 + i * 140]) for i in range(2)
+    ]
+    assert [x[:4] for x in namestrs] == [(2, 0, 200, 1), (1, 0, 8, 2)]
+    assert [x[4] for x in namestrs] == [b"id      ", b"amountVa"]
+    assert namestrs[0][5] == "Étude id".ljust(40).encode("latin-1")
+    assert [x[14] for x in namestrs] == [0, 200]
+    obs = 640 + 320
+    assert data[obs : obs + 80].startswith(b"HEADER RECORD*******OBS     HEADER")
+    rows = data[obs + 80 :]
+    assert len(rows) % 80 == 0
+    assert rows[:200].decode("utf-8") == text[:100]
+    assert from_ibm_float(rows[200:208]) == -2.5
+    assert rows[208:408].rstrip(b" ") == b"x"
+    assert from_ibm_float(rows[408:416]) is None
@@ -0,0 +1,60 @@
+import io
+import json
+import os
+import zipfile
+import pytest
+import yaml
+from release import ArchiveMember, find_deliverables
+from template_generator import TemplateGenerator, load_api
+
+
+def get_parts(template: io.BytesIO) -> dict:
+    # The parts of a workbook, except for its creation time.
+    with zipfile.ZipFile(template) as workbook:
+        return {
+            x: workbook.read(x)
+            for x in workbook.namelist()
+            if not x.startswith("docProps/")
+        }
+
+
+def make_release(model_files: tuple, path: str, version: str = "DDF-RA-1.0"):
+    with zipfile.ZipFile(path, "a") as archive:
+        for folder, file in zip(("UML", "CT", "API"), model_files):
+            archive.write(
+                file,
+                f"{version}/Deliverables/{folder}/{os.path.basename(file)}",
+            )
+
+
+def test_release_archive_matches_files(model_files, tmp_path):
+    release = str(tmp_path / "release.zip")
+    make_release(model_files, release)
+    files = find_deliverables(release)
+    assert files["xmi_file"] == ArchiveMember(
+        release, "DDF-RA-1.0/Deliverables/UML/USDM_UML.xmi"
+    )
+    expected = TemplateGenerator(*model_files).write(io.BytesIO())
+    template = TemplateGenerator(
+        files["xmi_file"], files["ct_file"], files["api_spec"]
+    ).write(io.BytesIO())
+    assert get_parts(template) == get_parts(expected)
+
+
+def test_release_with_several_versions(model_files, tmp_path):
+    release = str(tmp_path / "release.zip")
+    make_release(model_files, release, "DDF-RA-1.0")
+    make_release(model_files, release, "DDF-RA-2.0")
+    with pytest.raises(ValueError, match="several DDF versions"):
+        find_deliverables(release)
+
+
+@pytest.mark.parametrize("form", ["yaml", "json"])
+def test_api_spec_from_file_object(model_files, form):
+    with open(model_files[2], "rb") as f:
+        data = f.read()
+    if form == "json":
+        data = json.dumps(yaml.safe_load(data)).encode()
+    stream = io.BytesIO(data)
+    assert dict(load_api(stream).items()) == dict(load_api(model_files[2]).items())
+    assert not stream.closed
@@ -0,0 +1,73 @@
+import pytest
+from template_generator import TemplateGenerator
+
+
+class Unmemoized(dict):
+    # Subtree memo from which nothing is ever reused, so that every linked
+    # class is expanded for each entity and path.
+    def __contains__(self, key) -> bool:
+        return False
+
+
+def get_entities(generator: TemplateGenerator, entNames: list) -> dict:
+    return {
+        entName: (prps and prps.to_list(), reports)
+        for entName, (prps, reports) in zip(
+            entNames, map(generator.get_entity_properties, entNames)
+        )
+    }
+
+
+@pytest.mark.parametrize("max_depth", [None, 1])
+def test_memoized_expansion_matches_unmemoized(model_files, max_depth):
+    memoized = TemplateGenerator(*model_files, max_depth=max_depth)
+    unmemoized = TemplateGenerator(*model_files, max_depth=max_depth)
+    unmemoized.subtrees = Unmemoized()
+    entNames = list(memoized.entdict)
+    expected = get_entities(unmemoized, entNames)
+    assert any(
+        kind == ("circular_relationship" if max_depth is None else "max_depth_reached")
+        for _, reports in expected.values()
+        for kind, *_ in reports
+    )
+    assert get_entities(memoized, entNames) == expected
+
+
+@pytest.mark.parametrize("max_depth", [None, 1])
+def test_expansion_does_not_depend_on_entity_order(model_files, max_depth):
+    # As when the entities are split over worker processes, each with its own
+    # memo.
+    forward = TemplateGenerator(*model_files, max_depth=max_depth)
+    backward = TemplateGenerator(*model_files, max_depth=max_depth)
+    entNames = list(forward.entdict)
+    assert get_entities(backward, entNames[::-1]) == get_entities(forward, entNames)
+
+
+def test_max_depth_reports_name_their_entity(model_files):
+    generator = TemplateGenerator(*model_files, max_depth=1)
+    entities = get_entities(generator, list(generator.entdict))
+    messages = [
+        (entName, message)
+        for entName, (_, reports) in entities.items()
+        for kind, _, _, message in reports
+        if kind == "max_depth_reached"
+    ]
+    assert len({x for x, _ in messages}) > 1
+    for entName, message in messages:
+        assert message.startswith(f"Relationship '{entName}.")
+
+
+def test_circular_relationship_keeps_exists_column(model_files):
+    generator = TemplateGenerator(*model_files)
+    entities = get_entities(generator, list(generator.entdict))
+    circular = [
+        (entName, attribute)
+        for entName, (_, reports) in entities.items()
+        for kind, _, attribute, _ in reports
+        if kind == "circular_relationship"
+    ]
+    assert circular
+    for entName, attribute in circular:
+        columns = {x[0]: x for x in entities[entName][0]}
+        assert columns[attribute][1].endswith(" [Exists]")
+        assert not any(x.startswith(attribute + ".") for x in columns)
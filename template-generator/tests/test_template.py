@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import os
+import openpyxl
+from profiler import Profiler
+from template_generator import TemplateGenerator, load_api, load_ct
+from template_reader import TemplateReader
+from template_validator import TemplateValidator
+from xmi_reader import read_xmi
+
+# Values of the sheets of the template of the synthetic model of conftest, as
+# created by the generator. Rewritten instead of compared if UPDATE_BASELINE is
+# set, when the template is changed on purpose.
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def get_code(id: str, extensions: list) -> dict:
+    return {
+        "id": id,
+        "code": f"{id}-code",
+        "codeSystem": "system",
+        "codeSystemVersion": "1",
+        "decode": f"{id}-decode",
+        "instanceType": "Code",
+        "extensionAttributes": extensions,
+    }
+
+
+def get_document(usdmver: str) -> dict:
+    # A document of the AliasCode and Code classes of the synthetic model,
+    # with every required value given.
+    standardCode = get_code("C1", [])
+    del standardCode["extensionAttributes"]
+    return {
+        "aliasCode": {
+            "id": "A1",
+            "instanceType": "AliasCode",
+            "extensionAttributes": ["ext1", "ext2"],
+            "standardCode": standardCode,
+            "standardCodeAliases": [get_code("C2", []), get_code("C3", ["ext3"])],
+        },
+        "usdmVersion": usdmver,
+    }
+
+
+def get_sheets(template) -> dict:
+    workbook = openpyxl.load_workbook(template, read_only=True)
+    try:
+        return {
+            x: [list(row) for row in workbook[x].iter_rows(values_only=True)]
+            for x in workbook.sheetnames
+        }
+    finally:
+        workbook.close()
+
+
+def write_baseline(sheets: dict):
+    # One row per line, so that changes of the template are readable diffs.
+    with open(BASELINE, "w") as f:
+        f.write("{\n")
+        for n, (sheet, rows) in enumerate(sheets.items()):
+            f.write(f"{json.dumps(sheet)}: [\n")
+            f.write(",\n".join(json.dumps(x) for x in rows))
+            f.write("\n]" + ("," if n < len(sheets) - 1 else "") + "\n")
+        f.write("}\n")
+
+
+def test_template_matches_baseline(model_files):
+    sheets = get_sheets(TemplateGenerator(*model_files).write(io.BytesIO()))
+    if os.environ.get("UPDATE_BASELINE"):
+        write_baseline(sheets)
+    with open(BASELINE) as f:
+        assert sheets == json.load(f)
+
+
+def test_prefilled_template_reads_back(model_files, tmp_path):
+    template_file = str(tmp_path / "template.xlsx")
+    generator = TemplateGenerator(*model_files)
+    document = get_document(generator.usdmver)
+    generator.write(template_file, 1, False, [("study.json", document)])
+    assert not [
+        x for x in generator.diagnostics.get_findings() if x.kind.startswith("prefill_")
+    ]
+    reader = TemplateReader(template_file)
+    assert list(reader.read()) == [document]
+    assert not reader.diagnostics.get_findings()
+    assert not TemplateValidator(template_file).validate()
+
+
+def test_api_only_attributes_are_found_once(model_files):
+    generator = TemplateGenerator(*model_files)
+    findings = [
+        (x.entity, x.attribute) for x in generator.check() if x.kind.startswith("api_")
+    ]
+    assert findings
+    assert len(findings) == len(set(findings))
+
+
+def test_loaded_objects_keep_loader_reports(model_files):
+    reports = []
+    codelists = {}
+    apidict = load_api(model_files[2], reports)
+    entdict = load_ct(model_files[1], reports, codelists)
+    assert reports
+    generator = TemplateGenerator(
+        *model_files,
+        usdmxmi=read_xmi(model_files[0]),
+        apidict=apidict,
+        entdict=entdict,
+        codelists=codelists,
+        reports=reports,
+    )
+    expected = TemplateGenerator(*model_files, sequential_load=True)
+    assert generator.load_reports == expected.load_reports
+
+
+def test_profile_phases(model_files):
+    profiler = Profiler()
+    TemplateGenerator(*model_files, profiler=profiler, sequential_load=True)
+    names = [x["name"] for x in profiler.phases]
+    assert names.index("import_inflect") < names.index("resolve")
+    assert all(x["peak_rss"] > 0 for x in profiler.phases)
+    assert all(x["peak_memory"] is None for x in profiler.phases)
+
+
+def test_template_and_datasets_share_columns_and_documents(model_files, tmp_path):
+    template_file = str(tmp_path / "template.xlsx")
+    generator = TemplateGenerator(*model_files)
+    document = get_document(generator.usdmver)
+    computed = []
+    get_entity_properties = generator.get_entity_properties
+
+    def count_entity_properties(entName: str) -> tuple:
+        computed.append(entName)
+        return get_entity_properties(entName)
+
+    generator.get_entity_properties = count_entity_properties
+    generator.write(
+        template_file,
+        documents=iter([("study.json", document)]),
+        datasets_dir=str(tmp_path / "datasets"),
+        datasets_format="csv",
+    )
+    assert sorted(computed) == sorted(generator.entdict)
+    assert list(TemplateReader(template_file).read()) == [document]
+    with open(tmp_path / "datasets" / "AliasCode.csv", encoding="utf-8") as f:
+        assert list(csv.reader(f))[4][4] == "A1"
@@ -0,0 +1,33 @@
+import shutil
+from template_generator import TemplateGenerator
+
+# Named connectors of AliasCode without a target, and without the target's
+# model and type elements.
+INCOMPLETE_CONNECTORS = (
+    '<connector xmi:idref="EAID_X1" name="untargeted">'
+    + '<source xmi:idref="EAID_00000001"/></connector>'
+    + '<connector xmi:idref="EAID_X2" name="untyped">'
+    + '<source xmi:idref="EAID_00000001"/>'
+    + '<target xmi:idref="EAID_00000000"/></connector>'
+)
+
+
+def test_incomplete_connectors_are_reported(model_files, tmp_path):
+    xmi_file = str(tmp_path / "USDM_UML.xmi")
+    shutil.copy(model_files[0], xmi_file)
+    with open(xmi_file, encoding="utf-8") as f:
+        xmi = f.read()
+    with open(xmi_file, "w", encoding="utf-8") as f:
+        f.write(xmi.replace("<connectors>", "<connectors>" + INCOMPLETE_CONNECTORS))
+    expected = TemplateGenerator(*model_files)
+    generator = TemplateGenerator(xmi_file, *model_files[1:])
+    assert [
+        (x.entity, x.attribute)
+        for x in generator.diagnostics.get_findings()
+        if x.kind == "xmi_connector_incomplete"
+    ] == [("AliasCode", "untargeted"), ("AliasCode", "untyped")]
+    for entName in expected.entdict:
+        assert (
+            generator.get_entity_properties(entName)[0].to_list()
+            == expected.get_entity_properties(entName)[0].to_list()
+        )
@@ -0,0 +1,44 @@
+import argparse
+import sys
+from template_validator import TemplateValidator
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="""
+        USDM Test Data Template Validator. Checks that the test data in a
+        template created by create_template.py and filled with test data
+        (specified in the -t option) respects the types and cardinalities in
+        the header rows of its worksheets, and that the parent_entity and
+        parent_id of each row refer to an object in the workbook. Exits with a
+        non-zero status if any inconsistencies are found."""
+    )
+    parser.add_argument(
+        "-t",
+        "--template_file",
+        help="Filled test data template Excel file",
+        required=True,
+    )
+    parser.add_argument(
+        "-r",
+        "--report_file",
+        help="[Optional] JSON file to which the diagnostics are written.",
+        default=None,
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    validator = TemplateValidator(args.template_file)
+    findings = len(validator.validate())
+    print(validator.diagnostics.get_summary(validator.files), end="")
+    if args.report_file:
+        validator.diagnostics.write_report(args.report_file, validator.files)
+    print(f"{findings} inconsistencies found")
+    if findings:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+from typing import NamedTuple
+from release import open_input
+
+
+class UmlProperty(NamedTuple):
+    id: str
+    name: str
+
+
+class UmlClass(NamedTuple):
+    id: str
+    name: str
+    general: str
+    properties: tuple
+
+
+class UmlElement(NamedTuple):
+    id: str
+    name: str
+    isAbstract: str
+
+
+class UmlAttribute(NamedTuple):
+    type: str
+    lower: str
+    upper: str
+
+
+class UmlConnector(NamedTuple):
+    name: str
+    source: str
+    target: str
+    target_name: str
+    multiplicity: str
+
+
+class XmiModel:
+    # Compact model of the parts of an Enterprise Architect XMI export used
+    # by the template generator, with lookup tables keyed by xmi:id, class
+    # name, attribute idref and connector source.
+    def __init__(self):
+        self.classes = []
+        self.classes_by_id = {}
+        self.classes_by_name = {}
+        self.class_elements = []
+        self.elements = {}
+        self.attributes = {}
+        self.links = {}
+        self.incomplete_links = []
+        self.version = None
+
+    def get_class(self, name: str) -> UmlClass:
+        return self.classes_by_name.get(name)
+
+    def get_general(self, cls: UmlClass) -> UmlClass:
+        return self.classes_by_id.get(cls.general) if cls.general else None
+
+    def get_properties(self, cls: UmlClass) -> tuple:
+        return cls.properties
+
+    def get_attribute(self, prp: UmlProperty) -> UmlAttribute:
+        return self.attributes.get(prp.id)
+
+    def get_links(self, cls: UmlClass) -> list:
+        return self.links.get(cls.id, [])
+
+    def get_target(self, lnk: UmlConnector) -> UmlClass:
+        return self.classes_by_id.get(lnk.target)
+
+    def get_element(self, cls: UmlClass) -> UmlElement:
+        return self.elements.get(cls.id)
+
+    def has_member(self, cls: UmlClass, name: str) -> bool:
+        return any(prp.name == name for prp in cls.properties) or any(
+            lnk.name == name for lnk in self.get_links(cls)
+        )
+
+
+def read_xmi(source) -> XmiModel:
+    from lxml import etree
+
+    model = XmiModel()
+    readers = {
+        "packagedElement": read_class,
+        "element": read_element,
+        "attribute": read_attribute,
+        "connector": read_connector,
+        "diagram": read_diagram,
+    }
+    xmins = None
+    with open_input(source) as f:
+        for event, elem in etree.iterparse(
+            f, events=("start-ns", "end"), tag=tuple(readers), huge_tree=True
+        ):
+            if event == "start-ns":
+                if elem[0] == "xmi" and xmins is None:
+                    xmins = "{%s}" % elem[1]
+                continue
+            readers[elem.tag](model, elem, xmins)
+            # Release elements once read so that memory use does not grow with
+            # the size of the export.
+            elem.clear(keep_tail=True)
+            prev = elem.getprevious()
+            while prev is not None and prev.tag == elem.tag:
+                elem.getparent().remove(prev)
+                prev = elem.getprevious()
+    return model
+
+
+def read_class(model: XmiModel, elem, xmins: str):
+    if elem.get(xmins + "type") != "uml:Class":
+        return
+    gen = elem.find("generalization")
+    cls = UmlClass(
+        elem.get(xmins + "id"),
+        elem.get("name"),
+        gen.get("general") if gen is not None else None,
+        tuple(
+            UmlProperty(x.get(xmins + "id"), x.get("name"))
+            for x in elem.iterchildren("ownedAttribute")
+            if x.get(xmins + "type") == "uml:Property" and x.get("name") is not None
+        ),
+    )
+    model.classes.append(cls)
+    model.classes_by_id[cls.id] = cls
+    model.classes_by_name.setdefault(cls.name, cls)
+
+
+def read_element(model: XmiModel, elem, xmins: str):
+    if elem.get(xmins + "idref") is None:
+        return
+    props = elem.find("properties")
+    el = UmlElement(
+        elem.get(xmins + "idref"),
+        elem.get("name"),
+        props.get("isAbstract") if props is not None else None,
+    )
+    model.elements.setdefault(el.id, el)
+    if elem.get(xmins + "type") == "uml:Class":
+        model.class_elements.append(el)
+
+
+def read_attribute(model: XmiModel, elem, xmins: str):
+    if elem.get(xmins + "idref") is None:
+        return
+    props = elem.find("properties")
+    bounds = elem.find("bounds")
+    model.attributes.setdefault(
+        elem.get(xmins + "idref"),
+        UmlAttribute(
+            props.get("type") if props is not None else None,
+            bounds.get("lower") if bounds is not None else None,
+            bounds.get("upper") if bounds is not None else None,
+        ),
+    )
+
+
+def find_attribute(elem, path: str, name: str) -> str:
+    child = elem.find(path)
+    return child.get(name) if child is not None else None
+
+
+def read_connector(model: XmiModel, elem, xmins: str):
+    # Connectors without a source, target or multiplicity are not used as
+    # relationships, but kept by name and source to be reported.
+    if elem.get("name") is None:
+        return
+    lnk = UmlConnector(
+        elem.get("name"),
+        find_attribute(elem, "source", xmins + "idref"),
+        find_attribute(elem, "target", xmins + "idref"),
+        find_attribute(elem, "target/model", "name"),
+        find_attribute(elem, "target/type", "multiplicity"),
+    )
+    if lnk.source is None or lnk.target is None or lnk.multiplicity is None:
+        model.incomplete_links.append(lnk)
+    else:
+        model.links.setdefault(lnk.source, []).append(lnk)
+
+
+def read_diagram(model: XmiModel, elem, xmins: str):
+    props = elem.find("properties")
+    if (
+        model.version is None
+        and props is not None
+        and props.get("name") == "USDM"
+        and props.get("type") == "Logical"
+    ):
+        model.version = elem.find("project").get("version")
+
+
+def read_xmi_version(source) -> str:
+    # The USDM version of an XMI export, read without building its model.
+    from lxml import etree
+
+    model = XmiModel()
+    with open_input(source) as f:
+        for _, elem in etree.iterparse(f, tag="diagram", huge_tree=True):
+            read_diagram(model, elem, None)
+            if model.version is not None:
+                break
+            elem.clear(keep_tail=True)
+    return model.version